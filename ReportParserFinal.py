@@ -1,367 +1,300 @@
-import pandas as pd
+import argparse
 import glob
 import os
 import matplotlib.pyplot as plt
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
-import numpy as np
 
-
-# Step 1: Dynamically find all matching files
-file_path = r'C:\Users\cdunne\Documents\ASGARD_Mar'
-file_pattern = 'ASGARD_OTCDerivativesReport-*.csv'  # Modified to match any date
-matching_files = glob.glob(os.path.join(file_path, file_pattern))
-
-if len(matching_files) == 0:
-    print("No matching files found. Please check the directory and file pattern.")
-    exit()
-
-print(f"Found {len(matching_files)} files to process")
-
-
-# Function to extract date from filename
-def extract_date_from_filename(filename):
-    # Extract date from filename like ASGARD_OTCDerivativesReport-20250129
-    return filename.split('-')[-1].split('.')[0]
-
-
-# Initialize an empty list to store DataFrames
-all_data = []
-
-# Process each file
-for file_to_read in matching_files:
-    print(f"Reading file: {file_to_read}")
-
-    # Read the CSV and set the correct header row
-    data = pd.read_csv(file_to_read, header=13)
-    data.columns = data.columns.str.strip()
-
-    # Add Report Date column based on filename
-    report_date = extract_date_from_filename(file_to_read)
-    data['Report Date'] = report_date
-
-    # Rename specific columns
-    data = data.rename(columns={
-        'Unnamed: 0': 'Trade ID 1',
-        'Unnamed: 1': 'Trade ID 2',
-        'Unnamed: 5': 'Product Sub Type'
-    })
-
-    all_data.append(data)
-
-# Combine all DataFrames
-data = pd.concat(all_data, ignore_index=True)
-
-# Remove rows where 'Trade ID 1' is missing (i.e., remove totals row)
-data = data.dropna(subset=['Trade ID 1'])
-
-
-
-
-# Step 4: Ask user for the NAV
-try:
-    nav = float(input("Please add ME NAV (e.g., 456602278.79): "))
-except ValueError:
-    print("Invalid NAV entered. Please enter a numeric value.")
-    exit()
-
-# Step 5: Map Excel-like column references (A, B, F, etc.) to actual column names
-excel_columns = {
-    'A': data.columns[0],  # Replace with the actual column index for A TRADE1
-    'B': data.columns[1],  # Column B TRADE2
-    'G': data.columns[5],  # Column F Instrument Sub Type
-    'S': data.columns[21], # Column V Diff. in MV/IR DV01 or Diff. in MV/IDV01
-    'T': data.columns[22], # Column W Difference in MV
-    'U': data.columns[23], # Column X NAV Tolerance Analysis
-    'AZ': data.columns[51], # Column AZ
-    'BA': data.columns[52], # Column BA
-    'BB': data.columns[53], # Column BB
-    'BC': data.columns[54], # Column BC
-    'BD': data.columns[55], # Column BD
-    'BE': data.columns[56], # Column BE
-    'BF': data.columns[57], # Column BF REC RATE
-    'BG': data.columns[58], # Column BG PAY RATE
-    'AH': data.columns[32], # Column AG IRDVOL
-    'BP': data.columns[66] # Column BO
-}
-
-# Step 6: Convert numeric columns to proper numeric format
-numeric_columns = [excel_columns['T'], excel_columns['AH'], excel_columns['U'], excel_columns['S']]
-for col in numeric_columns:
-    data[col] = pd.to_numeric(data[col].replace(',', '', regex=True), errors='coerce')
-
-# Step 7: Filter the DataFrame using the mapped columns
-selected_columns = ['A', 'B', 'G', 'S','T','U', 'AZ', 'BA', 'BB', 'BC', 'BD', 'BE', 'BF', 'BG', 'AH', 'BP']
-df = data[[excel_columns[col] for col in selected_columns]].copy()
-
-
-
-
-def get_index(row):
-    # Function to check if a value is a pure number (including negative numbers and percentages)
-    def is_numeric_rate(value):
-        if not isinstance(value, str):
-            return True  # Already a number (float/int)
-        # Remove '%', spaces, and check if it can be converted to a float
-        cleaned = value.replace('%', '').replace(' ', '')
-        return cleaned.replace('.', '', 1).replace('-', '', 1).isdigit()
-
-    rec_rate = row['Rec Rate']
-    pay_rate = row['Pay Rate']
-
-    # Check if Rec Rate is NOT numeric, meaning it's likely an index
-    if not is_numeric_rate(rec_rate):
-        return rec_rate  # Rec Rate is a text (e.g., an index like "DKKCIBOR6M")
-    # If Rec Rate is numeric, check Pay Rate
-    elif not is_numeric_rate(pay_rate):
-        return pay_rate  # Pay Rate is- a text (index)
-    # If both are numeric, return None
-    return None
-
-# Apply the function to populate the Index column
-df['Index'] = df.apply(get_index, axis=1)
-
-# Optional: Verify the Index column doesn't contain any numeric values
-numeric_indices = df['Index'].str.contains(r'^[\d\.]+%?$', na=False)
-if numeric_indices.any():
-    print("Warning: Some numeric values found in Index column")
-    print(df[numeric_indices][['Rec Rate', 'Pay Rate', 'Index']])
-
-# Step 8: Add new columns for tolerance checks
-df['NAV Break (BPs)'] = (df[excel_columns['T']] / nav) * 10000
-df['Sensitivity Break (BPs)'] = df[excel_columns['T']] / df[excel_columns['AH']]
-
-# Step 9: Add Sensitivity Diff Check and NAV Break Check columns
-df['Sensitivity Diff Check (BPs)'] = df[excel_columns['S']] - df['Sensitivity Break (BPs)']
-df['NAV Break Check (BPs)'] = df[excel_columns['U']] - df['NAV Break (BPs)']
-
-# Step 10: Round specific columns to 2 decimal places
-columns_to_round = ['NAV Break (BPs)', 'Sensitivity Break (BPs)',
-                    'Sensitivity Diff Check (BPs)', 'NAV Break Check (BPs)']
-df[columns_to_round] = df[columns_to_round].round(2)
-
-# Step 11: Set up new columns
-df['Sensitivity Breach'] = None
-df['Tolerance Breach'] = None
-
-# Step 12: Ask the user which client they are analyzing
-client = input("Please enter the client you are analyzing (e.g., ASGARD): ").strip()
-
-if client.upper() == "ASGARD":
-    # Apply conditions for Tolerance Breach
-    df['Tolerance Breach'] = df['NAV Break (BPs)'].abs() > 1
-
-# Define the currency list
-ccy_list = ['USD', 'CAD', 'JPY', 'AUD', 'NZD', 'GBP', 'EUR', 'CHF', 'SEK', 'NOK']
-
-# Apply Sensitivity Breach logic
-df['Sensitivity Breach'] = df.apply(
-    lambda row: (
-        "TRUE" if (
-            # For currencies in the list
-            row['Ccy'] in ccy_list and
-            (
-                (row['Product Sub Type'] == "Plain Vanilla" and abs(row['Sensitivity Break (BPs)']) > 2) or
-                (row['Product Sub Type'] == "OIS" and abs(row['Sensitivity Break (BPs)']) > 1) or
-                (row['Product Sub Type'] == "MTM Cross Currency Swap" and abs(row['Sensitivity Break (BPs)']) > 4)
-            )
-        ) else (
-            # For currencies outside the list
-            "TRUE" if (
-                row['Ccy'] not in ccy_list and
-                (
-                    (row['Product Sub Type'] == "Plain Vanilla" and abs(row['Sensitivity Break (BPs)']) > 5) or
-                    (row['Product Sub Type'] == "OIS" and abs(row['Sensitivity Break (BPs)']) > 8) or
-                    (row['Product Sub Type'] == "MTM Cross Currency Swap" and abs(row['Sensitivity Break (BPs)']) > 9)
-                )
-            ) else "FALSE"
+from breach_cube import breach_rows, build_breach_cube, daily_counts, product_ccy_counts, top_n_per_group
+from breach_delta import breach_deltas, stored_tracker
+from breach_rules import sensitivity_breach, tolerance_breach
+from excel_export import write_report
+from nav_history import DERIVATIVES_DATASET, HistoryStore
+from nav_ingest import load_reports
+from parse_cache import ParseCache
+from rate_parsing import detect_index
+from trade_schema import compact_trades, describe_memory_change, join_labels, memory_usage
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Process daily OTC derivatives NAV reports.")
+    parser.add_argument('--path', default=r'C:\Users\cdunne\Documents\ASGARD_Mar',
+                        help="Folder containing the daily report CSVs")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Number of processes used to parse the files (1 = serial)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Re-parse every file instead of using the on-disk parse cache")
+    parser.add_argument('--history-dir', default=None,
+                        help="History store the processed report dates are added to (default: ~/.nav_history)")
+    parser.add_argument('--no-history', action='store_true',
+                        help="Do not add the processed report dates to the history store")
+    parser.add_argument('--trend-from', default=None,
+                        help="Draw the trend charts from the stored history starting at this date (e.g. 2025-01-01)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Step 1: Dynamically find all matching files
+    file_path = args.path
+    file_pattern = 'ASGARD_OTCDerivativesReport-*.csv'  # Modified to match any date
+    matching_files = glob.glob(os.path.join(file_path, file_pattern))
+
+    if len(matching_files) == 0:
+        print("No matching files found. Please check the directory and file pattern.")
+        exit()
+
+    print(f"Found {len(matching_files)} files to process using {args.workers} worker(s)")
+
+    # Steps 2-3: Read, normalise and combine every file (in parallel when workers > 1),
+    # removing rows where 'Trade ID 1' is missing (i.e., remove totals row)
+    cache = None if args.no_cache else ParseCache()
+    data = load_reports(matching_files, workers=args.workers, cache=cache)
+
+    # Step 4: Ask user for the NAV
+    try:
+        nav = float(input("Please add ME NAV (e.g., 456602278.79): "))
+    except ValueError:
+        print("Invalid NAV entered. Please enter a numeric value.")
+        exit()
+
+    # Step 5: Map Excel-like column references (A, B, F, etc.) to actual column names.
+    # The reader only loads these columns, in this order (see report_layout.DERIVATIVES_FIELDS)
+    selected_columns = ['A', 'B', 'G', 'S','T','U', 'AZ', 'BA', 'BB', 'BC', 'BD', 'BE', 'BF', 'BG', 'AH', 'BP']
+    excel_columns = dict(zip(selected_columns, data.columns))
+
+    # Step 6: The numeric columns are parsed as floats by the reader; report any cells that were not numbers
+    for col, count in data.attrs['unparseable'].items():
+        if count:
+            print(f"Warning: {count} value(s) in '{col}' are not numbers and were left empty")
+
+    # Step 7: The projected frame (plus its Report Date) is the working DataFrame, no extra copy needed
+    df = data
+
+
+
+
+    # Work out the floating rate index and the fixed leg rate from Rec Rate / Pay Rate (see rate_parsing.py)
+    df['Index'], df['Fixed Rate'] = detect_index(df['Rec Rate'], df['Pay Rate'])
+
+    # Optional: Verify the Index column doesn't contain any numeric values
+    numeric_indices = df['Index'].str.contains(r'^[\d\.]+%?$', na=False)
+    if numeric_indices.any():
+        print("Warning: Some numeric values found in Index column")
+        print(df[numeric_indices][['Rec Rate', 'Pay Rate', 'Index']])
+
+    # Step 8: Add new columns for tolerance checks
+    df['NAV Break (BPs)'] = (df[excel_columns['T']] / nav) * 10000
+    df['Sensitivity Break (BPs)'] = df[excel_columns['T']] / df[excel_columns['AH']]
+
+    # Step 9: Add Sensitivity Diff Check and NAV Break Check columns
+    df['Sensitivity Diff Check (BPs)'] = df[excel_columns['S']] - df['Sensitivity Break (BPs)']
+    df['NAV Break Check (BPs)'] = df[excel_columns['U']] - df['NAV Break (BPs)']
+
+    # Step 10: Round specific columns to 2 decimal places
+    columns_to_round = ['NAV Break (BPs)', 'Sensitivity Break (BPs)',
+                        'Sensitivity Diff Check (BPs)', 'NAV Break Check (BPs)']
+    df[columns_to_round] = df[columns_to_round].round(2)
+
+    # Step 11: Set up new columns
+    df['Sensitivity Breach'] = None
+    df['Tolerance Breach'] = None
+
+    # Step 12: Ask the user which client they are analyzing
+    client = input("Please enter the client you are analyzing (e.g., ASGARD): ").strip()
+
+    # Apply the client's Tolerance and Sensitivity Breach thresholds (see breach_rules.py)
+    tolerance = tolerance_breach(df['NAV Break (BPs)'], client)
+    if tolerance is not None:
+        df['Tolerance Breach'] = tolerance
+
+    df['Sensitivity Breach'] = sensitivity_breach(
+        df['Ccy'], df['Product Sub Type'], df['Sensitivity Break (BPs)'], client
+    )
+
+    # Cast to the compact schema (categoricals, real booleans, datetime64, float32) before export and charts
+    memory_before = memory_usage(df)
+    compact_trades(df)
+    print(describe_memory_change(memory_before, memory_usage(df)))
+
+    # History store of the processed report dates (see nav_history.py)
+    history = None if args.no_history else HistoryStore(args.history_dir, DERIVATIVES_DATASET)
+
+    # Day-over-day changes: which breaches are new, persisting or resolved since the previous report.
+    # The first report date is compared with the last one stored before it.
+    for breach_column in ["Sensitivity Breach", "Tolerance Breach"]:
+        tracker = None
+        if history is not None and client:
+            tracker = stored_tracker(history, client, df['Report Date'].min(), breach_column)
+        df[f'{breach_column} Status'], df[f'{breach_column} Streak'], delta_summary = breach_deltas(
+            df, 'Report Date', breach_column, tracker=tracker
         )
-    ), axis=1
-)
-
-# Step 13: Save the updated DataFrame to an Excel file
-output_file = os.path.join(file_path, f'Processed_ASGARD_Report_with_Breaches.xlsx')
-df.to_excel(output_file, index=False, engine='openpyxl', sheet_name="Processed Report")
-print(f"Processed data with breaches saved to: {output_file}")
-
-# Step 14: Apply conditional formatting for TRUE/FALSE
-wb = load_workbook(output_file)
-
-ws = wb["Processed Report"]
-# Ensure both columns are in string format for consistent conditional formatting
-df['Sensitivity Breach'] = df['Sensitivity Breach'].astype(str)
-df['Tolerance Breach'] = df['Tolerance Breach'].astype(str)
-
-# Identify columns for conditional formatting
-columns_to_format = ["Sensitivity Breach", "Tolerance Breach"]
-true_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")  # Red for TRUE
-false_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")  # Green for FALSE
-
-# Apply conditional formatting for both columns
-for col in columns_to_format:
-    if col in df.columns:  # Ensure the column exists
-        col_idx = df.columns.get_loc(col) + 1  # Get column index (1-based for Excel)
-        for row in range(2, len(df) + 2):  # Start from row 2 (skip header)
-            cell = ws.cell(row=row, column=col_idx)
-            if str(cell.value).upper() == "TRUE":
-                cell.fill = true_fill
-            elif str(cell.value).upper() == "FALSE":
-                cell.fill = false_fill
-    else:
-        print(f"Warning: Column '{col}' not found in DataFrame. Skipping conditional formatting.")
-
-# Save the workbook with formatting
-wb.save(output_file)
-print(f"Conditional formatting applied and saved to: {output_file}")
-
-
-# Ensure Tolerance Breach is a boolean before plotting
-df['Tolerance Breach'] = df['Tolerance Breach'].str.upper() == "TRUE"
-
-# Step 14: Visualization - Breaches grouped by Product Type and Ccy
-df['Product_Ccy'] = df['Product Sub Type'] + "_" + df['Ccy']  # Combine Product Type and Ccy
-
-# Count Sensitivity Breach (TRUE) grouped by Product_Ccy
-sensitivity_breach_counts = df[df['Sensitivity Breach'] == "TRUE"]['Product_Ccy'].value_counts()
-
-# Count Tolerance Breach (TRUE) grouped by Product_Ccy
-tolerance_breach_counts = df[df['Tolerance Breach'] == True]['Product_Ccy'].value_counts()
-
-# Align indices of both counts (fill missing values with 0)
-all_product_ccy = sensitivity_breach_counts.index.union(tolerance_breach_counts.index)
-sensitivity_breach_counts = sensitivity_breach_counts.reindex(all_product_ccy, fill_value=0)
-tolerance_breach_counts = tolerance_breach_counts.reindex(all_product_ccy, fill_value=0)
-
-# Plotting both charts stacked
-fig, axes = plt.subplots(3, 1, figsize=(14, 16), sharex=True)
-
-# Function to add values inside bars
-def add_bar_labels(ax):
-    for bar in ax.patches:
-        height = bar.get_height()
-        if height > 0:
-            ax.text(
-                bar.get_x() + bar.get_width() / 2,
-                height * 0.5,  # Position inside the bar
-                str(int(height)),
-                ha='center',
-                va='center',  # Centered inside the bar
-                fontsize=12,
-                fontweight='bold',
-                color='white'  # White text for contrast
-            )
-
-# Sensitivity Breach Chart
-bars1 = axes[0].bar(
-    sensitivity_breach_counts.index,
-    sensitivity_breach_counts,
-    color='skyblue',
-    edgecolor='black'  # Solid border
-)
-axes[0].set_title("Count of Sensitivity Breaches by Product Type and Ccy", fontsize=14)
-axes[0].set_ylabel("Count of Sensitivity Breaches", fontsize=12)
-axes[0].tick_params(axis='x', rotation=45, labelsize=10)
-axes[0].grid(True, linestyle='--', alpha=0.6)  # Grid background
-add_bar_labels(axes[0])  # Add labels inside bars
-
-# Tolerance Breach Chart
-bars2 = axes[1].bar(
-    tolerance_breach_counts.index,
-    tolerance_breach_counts,
-    color='lightcoral',
-    edgecolor='black'  # Solid border
-)
-axes[1].set_title("Count of Tolerance Breaches by Product Type and Ccy", fontsize=14)
-axes[1].set_ylabel("Count of Tolerance Breaches", fontsize=12)
-axes[1].tick_params(axis='x', rotation=45, labelsize=10)
-axes[1].grid(True, linestyle='--', alpha=0.6)  # Grid background
-add_bar_labels(axes[1])  # Add labels inside bars
-
-# New third chart (Immediate Attention Required)
-# Filter for trades with both Sensitivity and Tolerance breaches
-immediate_attention_df = df[
-    (df['Sensitivity Breach'] == "TRUE") &
-    (df['Tolerance Breach'] == True)
-]
-immediate_attention_counts = immediate_attention_df['Product_Ccy'].value_counts()
-
-bars3 = axes[2].bar(
-    immediate_attention_counts.index,
-    immediate_attention_counts,
-    color='darkred',  # Darker red to indicate urgency
-    edgecolor='black'
-)
-axes[2].set_title("Breaks Requiring Immediate Attention (Both Sensitivity & Tolerance Breaches)", fontsize=14)
-axes[2].set_ylabel("Count of Critical Breaches", fontsize=12)
-axes[2].tick_params(axis='x', rotation=45, labelsize=10)
-axes[2].grid(True, linestyle='--', alpha=0.6)
-add_bar_labels(axes[2])
-
-# Adjust layout for all three charts
-plt.tight_layout()
-
-# Second Chart: Trends in Sensitivity Breaches by Index and Curve Pillar
-
-# Extract the year from Maturity Date and add a "Maturity Year" column
-df['Maturity Year'] = pd.to_datetime(df['Maturity Date'], errors='coerce').dt.year.astype('Int64')
-
-# Create a new column for the Index and Maturity Year concatenation
-df['Index_Maturity'] = df['Index'] + "_" + df['Maturity Year'].astype(str)
-
-# Filter data for the analysis
-filtered_df = df[
-    (df['Sensitivity Breach'] == "TRUE") &
-    (df['Product Sub Type'] != "MTM Cross Currency Swap")
-]
-
-# Group by Index_Maturity and count Sensitivity Breaches
-breach_counts = filtered_df.groupby(['Ccy', 'Index_Maturity']).size().reset_index(name='Breach Count')
-
-# Get the top 5 Index Maturities **per currency**
-top_5_per_currency = breach_counts.groupby('Ccy').apply(lambda x: x.nlargest(5, 'Breach Count')).reset_index(drop=True)
-
-
-
-# Create a figure with subplots for each unique currency
-unique_ccys = top_5_per_currency['Ccy'].unique()
-fig, axes = plt.subplots(len(unique_ccys), 1, figsize=(15, 5 * len(unique_ccys)), sharex=True)
-
-# Ensure axes is iterable even if there's only one currency
-if len(unique_ccys) == 1:
-    axes = [axes]
-
-# Plot data for each currency separately
-for ax, ccy in zip(axes, unique_ccys):
-    top_5_indices = top_5_per_currency[top_5_per_currency['Ccy'] == ccy]['Index_Maturity'].tolist()
-
-    # Filter dataset for the selected currency and top 5 Index_Maturities
-    ccy_data = df[
-        (df['Ccy'] == ccy) &
-        (df['Index_Maturity'].isin(top_5_indices)) &
-        (df['Sensitivity Breach'] == "TRUE") &
-        (df['Product Sub Type'] != "MTM Cross Currency Swap")
-    ].groupby(['Plot Date', 'Index_Maturity']).size().unstack(fill_value=0)
-
-    # Plot each Index Maturity in this currency's chart
-    for column in ccy_data.columns:
-        ax.plot(ccy_data.index, ccy_data[column], marker='o', label=column)  # Dots added back
-
-    # Customize each subplot
-    ax.set_title(f"Daily Sensitivity Breaches for {ccy} (Top 5 Index Maturities)", fontsize=14)
-    ax.set_xlabel("Date", fontsize=12)
-    ax.set_ylabel("Number of Breaches", fontsize=12)
-    ax.grid(True, linestyle='--', alpha=0.6)
-    ax.legend(title="Index Maturity", fontsize=8, bbox_to_anchor=(1.05, 1), loc='upper left')
-
-# Rotate x-axis labels for readability
-plt.xticks(rotation=45)
-
-# Adjust layout to prevent overlap
-plt.tight_layout()
-
-# Show all plots
-plt.show()
-
-
+        print(f"\n{breach_column} changes by report date:")
+        print(delta_summary.to_string())
 
+    # Step 13: Save the updated DataFrame to an Excel file, with TRUE/FALSE highlighted by conditional formatting
+    output_file = os.path.join(file_path, f'Processed_ASGARD_Report_with_Breaches.xlsx')
+    for col in write_report(df, output_file, sheet_name="Processed Report"):
+        print(f"Warning: Column '{col}' not found in DataFrame. Skipping conditional formatting.")
+    print(f"Processed data with breaches saved to: {output_file}")
+
+
+    # Ensure Tolerance Breach is a boolean before plotting
+    df['Tolerance Breach'] = df['Tolerance Breach'].fillna(False).astype(bool)
+
+    # Extract the year from Maturity Date (parsed by the reader) and add a "Maturity Year" column
+    df['Maturity Year'] = df['Maturity Date'].dt.year.astype('Int64')
+
+    # Create a new column for the Index and Maturity Year concatenation
+    df['Index_Maturity'] = join_labels(df['Index'], df['Maturity Year'].astype(str))
+
+    # Add the processed report dates to the history store, replacing any earlier run of the same dates
+    if history is not None and client:
+        stored_dates = history.append(df, client, 'Report Date')
+        print(f"Stored {len(stored_dates)} report dates for {client.upper()} in {history.store_dir}")
+
+    # Trend charts cover this run's reports, or the stored history when asked for.
+    # Only the partitions in the date range and the columns the cube needs are read.
+    trend_data = df
+    if history is not None and client and args.trend_from:
+        trend_columns = ['Report Date', 'Ccy', 'Product Sub Type', 'Index_Maturity',
+                         'Sensitivity Breach', 'Tolerance Breach', excel_columns['T']]
+        stored = history.read(client, start=args.trend_from, columns=trend_columns)
+        if stored is None:
+            print(f"No report dates stored from {args.trend_from}, trend charts use this run's reports")
+        else:
+            trend_data = stored
+            print(f"Trend charts use {trend_data['Report Date'].nunique()} stored report dates from {args.trend_from}")
+
+    # Step 14: Aggregate all breaches once into a cube over (date, Ccy, product, Index_Maturity, breach type).
+    # Every chart below reads from the cube instead of re-filtering the trades.
+    cube = build_breach_cube(trend_data, 'Report Date', 'Ccy', value=excel_columns['T'])
+
+    # Count Sensitivity Breach (TRUE) grouped by Product_Ccy
+    sensitivity_breach_counts = product_ccy_counts(cube, 'Sensitivity')
+
+    # Count Tolerance Breach (TRUE) grouped by Product_Ccy
+    tolerance_breach_counts = product_ccy_counts(cube, 'Tolerance')
+
+    # Align indices of both counts (fill missing values with 0)
+    all_product_ccy = sensitivity_breach_counts.index.union(tolerance_breach_counts.index)
+    sensitivity_breach_counts = sensitivity_breach_counts.reindex(all_product_ccy, fill_value=0)
+    tolerance_breach_counts = tolerance_breach_counts.reindex(all_product_ccy, fill_value=0)
+
+    # Plotting both charts stacked
+    fig, axes = plt.subplots(3, 1, figsize=(14, 16), sharex=True)
+
+    # Function to add values inside bars
+    def add_bar_labels(ax):
+        for bar in ax.patches:
+            height = bar.get_height()
+            if height > 0:
+                ax.text(
+                    bar.get_x() + bar.get_width() / 2,
+                    height * 0.5,  # Position inside the bar
+                    str(int(height)),
+                    ha='center',
+                    va='center',  # Centered inside the bar
+                    fontsize=12,
+                    fontweight='bold',
+                    color='white'  # White text for contrast
+                )
 
+    # Sensitivity Breach Chart
+    bars1 = axes[0].bar(
+        sensitivity_breach_counts.index,
+        sensitivity_breach_counts,
+        color='skyblue',
+        edgecolor='black'  # Solid border
+    )
+    axes[0].set_title("Count of Sensitivity Breaches by Product Type and Ccy", fontsize=14)
+    axes[0].set_ylabel("Count of Sensitivity Breaches", fontsize=12)
+    axes[0].tick_params(axis='x', rotation=45, labelsize=10)
+    axes[0].grid(True, linestyle='--', alpha=0.6)  # Grid background
+    add_bar_labels(axes[0])  # Add labels inside bars
+
+    # Tolerance Breach Chart
+    bars2 = axes[1].bar(
+        tolerance_breach_counts.index,
+        tolerance_breach_counts,
+        color='lightcoral',
+        edgecolor='black'  # Solid border
+    )
+    axes[1].set_title("Count of Tolerance Breaches by Product Type and Ccy", fontsize=14)
+    axes[1].set_ylabel("Count of Tolerance Breaches", fontsize=12)
+    axes[1].tick_params(axis='x', rotation=45, labelsize=10)
+    axes[1].grid(True, linestyle='--', alpha=0.6)  # Grid background
+    add_bar_labels(axes[1])  # Add labels inside bars
+
+    # New third chart (Immediate Attention Required)
+    # Trades with both Sensitivity and Tolerance breaches
+    immediate_attention_counts = product_ccy_counts(cube, 'Both')
+
+    bars3 = axes[2].bar(
+        immediate_attention_counts.index,
+        immediate_attention_counts,
+        color='darkred',  # Darker red to indicate urgency
+        edgecolor='black'
+    )
+    axes[2].set_title("Breaks Requiring Immediate Attention (Both Sensitivity & Tolerance Breaches)", fontsize=14)
+    axes[2].set_ylabel("Count of Critical Breaches", fontsize=12)
+    axes[2].tick_params(axis='x', rotation=45, labelsize=10)
+    axes[2].grid(True, linestyle='--', alpha=0.6)
+    add_bar_labels(axes[2])
+
+    # Adjust layout for all three charts
+    plt.tight_layout()
+
+    # Second Chart: Trends in Sensitivity Breaches by Index and Curve Pillar
+
+    # Sensitivity breaches, without MTM Cross Currency Swaps
+    trend_cube = breach_rows(cube, 'Sensitivity', exclude_products=["MTM Cross Currency Swap"])
+
+    # Group by Index_Maturity and count Sensitivity Breaches
+    breach_counts = trend_cube.groupby(['Ccy', 'Index_Maturity'], observed=True)['Count'].sum().reset_index(name='Breach Count')
+
+    # Get the top 5 Index Maturities **per currency**
+    top_5_per_currency = top_n_per_group(breach_counts, 'Ccy', 'Breach Count', n=5)
+
+
+
+    # Create a figure with subplots for each unique currency
+    unique_ccys = top_5_per_currency['Ccy'].unique()
+    fig, axes = plt.subplots(len(unique_ccys), 1, figsize=(15, 5 * len(unique_ccys)), sharex=True)
+
+    # Ensure axes is iterable even if there's only one currency
+    if len(unique_ccys) == 1:
+        axes = [axes]
+
+    # Plot data for each currency separately
+    for ax, ccy in zip(axes, unique_ccys):
+        top_5_indices = top_5_per_currency[top_5_per_currency['Ccy'] == ccy]['Index_Maturity'].tolist()
+
+        # Daily counts for the selected currency and top 5 Index_Maturities
+        ccy_data = daily_counts(trend_cube[
+            (trend_cube['Ccy'] == ccy) &
+            (trend_cube['Index_Maturity'].isin(top_5_indices))
+        ])
+
+        # Plot each Index Maturity in this currency's chart
+        for column in ccy_data.columns:
+            ax.plot(ccy_data.index, ccy_data[column], marker='o', label=column)  # Dots added back
+
+        # Customize each subplot
+        ax.set_title(f"Daily Sensitivity Breaches for {ccy} (Top 5 Index Maturities)", fontsize=14)
+        ax.set_xlabel("Date", fontsize=12)
+        ax.set_ylabel("Number of Breaches", fontsize=12)
+        ax.grid(True, linestyle='--', alpha=0.6)
+        ax.legend(title="Index Maturity", fontsize=8, bbox_to_anchor=(1.05, 1), loc='upper left')
+
+    # Rotate x-axis labels for readability
+    plt.xticks(rotation=45)
+
+    # Adjust layout to prevent overlap
+    plt.tight_layout()
+
+    # Show all plots
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
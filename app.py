@@ -3,10 +3,18 @@ import pandas as pd
 import glob
 import os
 import matplotlib.pyplot as plt
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
 import numpy as np
 
+from breach_cube import breach_rows, build_breach_cube, daily_counts, product_ccy_counts, top_n_per_group
+from breach_delta import breach_deltas, stored_tracker
+from breach_rules import sensitivity_breach, tolerance_breach
+from excel_export import write_report
+from nav_history import DERIVATIVES_DATASET, HistoryStore
+from nav_ingest import CSV_PARSER_VERSION, load_report_csv, unparseable_counts
+from parse_cache import MemoryCache, ParseCache
+from rate_parsing import detect_index
+from trade_schema import compact_trades, describe_memory_change, join_labels, memory_usage
+
 # Streamlit App Title
 st.title("OTC Daily NAV IRS Report Processor")
 
@@ -24,64 +32,59 @@ if not client or nav <= 0:
     st.warning("Please enter a valid client and NAV.")
     st.stop()
 
-# Process the files
-all_data = []
-
-for uploaded_file in uploaded_files:
-    st.write(f"Reading file: {uploaded_file.name}")
-    data = pd.read_csv(uploaded_file, header=13)
-    data.columns = data.columns.str.strip()
-
-    # Add Report Date column based on filename
-    report_date = uploaded_file.name.split('-')[-1].split('.')[0]
-    data['Report Date'] = report_date
-
-    # Rename specific columns
-    data = data.rename(columns={
-        'Unnamed: 0': 'Trade ID 1',
-        'Unnamed: 1': 'Trade ID 2',
-        'Unnamed: 5': 'Product Sub Type'
-    })
-
-    all_data.append(data)
-
-# Combine all DataFrames
-data = pd.concat(all_data, ignore_index=True)
-
-# Remove rows where 'Trade ID 1' is missing
-data = data.dropna(subset=['Trade ID 1'])
-
-# Step 3: Map Excel-like column references to actual column names
-excel_columns = {
-    'A': data.columns[0],  # Replace with the actual column index for A
-    'B': data.columns[1],  # Column B
-    'F': data.columns[5],  # Column F
-    'V': data.columns[21], # Column V
-    'W': data.columns[22], # Column W
-    'X': data.columns[23], # Column X
-    'AZ': data.columns[51], # Column AZ
-    'BA': data.columns[52], # Column BA
-    'BB': data.columns[53], # Column BB
-    'BC': data.columns[54], # Column BC
-    'BD': data.columns[55], # Column BD
-    'BE': data.columns[56], # Column BE
-    'BF': data.columns[57], # Column BF
-    'BG': data.columns[58], # Column BG
-    'AG': data.columns[32], # Column AG
-    'BO': data.columns[66] # Column BO
-}
-
-# Step 4: Convert numeric columns to proper numeric format
-numeric_columns = [excel_columns['W'], excel_columns['AG'], excel_columns['X'], excel_columns['V']]
-for col in numeric_columns:
-    data[col] = pd.to_numeric(data[col].replace(',', '', regex=True), errors='coerce')
-
-# Step 5: Filter the DataFrame using the mapped columns
+# Step 3: Map Excel-like column references to actual column names.
+# The reader only loads these columns, in this order (see report_layout.DERIVATIVES_FIELDS)
 selected_columns = ['A', 'B', 'F', 'V','W','X', 'AZ', 'BA', 'BB', 'BC', 'BD', 'BE', 'BF', 'BG', 'AG', 'BO']
-df = data[[excel_columns[col] for col in selected_columns]].copy()
 
-# Convert Final Source Load Time to DDMMYYYY format
-df['Final Source Load Time'] = pd.to_datetime(df['Final Source Loa    d Time']).dt.strftime('%d%m%Y')
+
+# Parsed and normalised uploads are kept in memory between reruns, so changing a widget
+# does not read the reports again. The memory cache lives as long as the app process.
+@st.cache_resource
+def get_memory_cache():
+    return MemoryCache()
+
+
+def normalise_reports(uploaded_files):
+    """Read every upload and normalise the combined frame (Steps 4-5). Depends only on the files, not the client or NAV."""
+    # Unchanged uploads are served from the on-disk parse cache
+    cache = ParseCache()
+    all_data = []
+
+    for uploaded_file in uploaded_files:
+        st.write(f"Reading file: {uploaded_file.name}")
+        all_data.append(load_report_csv(uploaded_file, uploaded_file.name, cache))
+
+    cache.evict()
+
+    # Combine all DataFrames
+    data = pd.concat(all_data, ignore_index=True)
+
+    # Remove rows where 'Trade ID 1' is missing
+    data = data.dropna(subset=['Trade ID 1'])
+
+    # Step 4: The numeric columns are parsed as floats by the reader, keep the count of cells that were not numbers
+    data.attrs['unparseable'] = unparseable_counts(all_data)
+
+    # Step 5: The projected frame (plus its Report Date) is the working DataFrame, no extra copy needed
+    df = data
+
+    # Final Source Load Time arrives as a datetime, keep only its day
+    df['Final Source Load Time'] = df['Final Source Load Time'].dt.normalize()
+
+    return df
+
+
+memory_cache = get_memory_cache()
+upload_digests = [memory_cache.upload_digest(uploaded_file) for uploaded_file in uploaded_files]
+df = memory_cache.get_or_build(
+    memory_cache.key(upload_digests, 'csv-upload', CSV_PARSER_VERSION),
+    lambda: normalise_reports(uploaded_files)
+)
+excel_columns = dict(zip(selected_columns, df.columns))
+
+for col, count in df.attrs.get('unparseable', {}).items():
+    if count:
+        st.warning(f"{count} value(s) in '{col}' are not numbers and were left empty.")
 
 # Step 6: Add new columns for tolerance checks
 df['NAV Break (BPs)'] = (df[excel_columns['W']] / nav) * 10000
@@ -100,68 +103,38 @@ df[columns_to_round] = df[columns_to_round].round(2)
 df['Sensitivity Breach'] = None
 df['Tolerance Breach'] = None
 
-# Step 10: Apply conditions for Tolerance Breach
-if client == "ASGARD":
-    df['Tolerance Breach'] = df['NAV Break (BPs)'].abs() > 1
-
-# Define the currency list
-ccy_list = ['USD', 'CAD', 'JPY', 'AUD', 'NZD', 'GBP', 'EUR', 'CHF', 'SEK', 'NOK']
-
-# Apply Sensitivity Breach logic
-df['Sensitivity Breach'] = df.apply(
-    lambda row: (
-        "TRUE" if (
-            row['Ccy'] in ccy_list and
-            (
-                (row['Product Sub Type'] == "Plain Vanilla" and abs(row['Sensitivity Break (BPs)']) > 2) or
-                (row['Product Sub Type'] == "OIS" and abs(row['Sensitivity Break (BPs)']) > 1) or
-                (row['Product Sub Type'] == "MTM Cross Currency Swap" and abs(row['Sensitivity Break (BPs)']) > 4)
-            )
-        ) else (
-            "TRUE" if (
-                row['Ccy'] not in ccy_list and
-                (
-                    (row['Product Sub Type'] == "Plain Vanilla" and abs(row['Sensitivity Break (BPs)']) > 5) or
-                    (row['Product Sub Type'] == "OIS" and abs(row['Sensitivity Break (BPs)']) > 8) or
-                    (row['Product Sub Type'] == "MTM Cross Currency Swap" and abs(row['Sensitivity Break (BPs)']) > 9)
-                )
-            ) else "FALSE"
-        )
-    ), axis=1
+# Step 10: Apply the client's Tolerance and Sensitivity Breach thresholds (see breach_rules.py)
+tolerance = tolerance_breach(df['NAV Break (BPs)'], client)
+if tolerance is not None:
+    df['Tolerance Breach'] = tolerance
+
+df['Sensitivity Breach'] = sensitivity_breach(
+    df['Ccy'], df['Product Sub Type'], df['Sensitivity Break (BPs)'], client
 )
 
-# Step 11: Save the updated DataFrame to an Excel file
+# Cast to the compact schema (categoricals, real booleans, datetime64, float32) before export and charts
+memory_before = memory_usage(df)
+compact_trades(df)
+st.write(describe_memory_change(memory_before, memory_usage(df)))
+
+# History store of the processed report dates (see nav_history.py)
+history = HistoryStore(dataset=DERIVATIVES_DATASET)
+
+# Day-over-day changes: which breaches are new, persisting or resolved since the previous report.
+# The first report date is compared with the last one stored before it.
+st.subheader("Breach Changes by Report Date")
+for breach_column in ["Sensitivity Breach", "Tolerance Breach"]:
+    tracker = stored_tracker(history, client, df['Report Date'].min(), breach_column)
+    df[f'{breach_column} Status'], df[f'{breach_column} Streak'], delta_summary = breach_deltas(
+        df, 'Report Date', breach_column, tracker=tracker
+    )
+    st.write(f"**{breach_column}**")
+    st.write(delta_summary)
+
+# Step 11: Save the updated DataFrame to an Excel file, with TRUE/FALSE highlighted by conditional formatting
 output_file = "Processed_ASGARD_Report_with_Breaches.xlsx"
-df.to_excel(output_file, index=False, engine='openpyxl', sheet_name="Processed Report")
-
-# Step 12: Apply conditional formatting for TRUE/FALSE
-wb = load_workbook(output_file)
-ws = wb["Processed Report"]
-
-# Ensure both columns are in string format for consistent conditional formatting
-df['Sensitivity Breach'] = df['Sensitivity Breach'].astype(str)
-df['Tolerance Breach'] = df['Tolerance Breach'].astype(str)
-
-# Identify columns for conditional formatting
-columns_to_format = ["Sensitivity Breach", "Tolerance Breach"]
-true_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")  # Red for TRUE
-false_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")  # Green for FALSE
-
-# Apply conditional formatting for both columns
-for col in columns_to_format:
-    if col in df.columns:  # Ensure the column exists
-        col_idx = df.columns.get_loc(col) + 1  # Get column index (1-based for Excel)
-        for row in range(2, len(df) + 2):  # Start from row 2 (skip header)
-            cell = ws.cell(row=row, column=col_idx)
-            if str(cell.value).upper() == "TRUE":
-                cell.fill = true_fill
-            elif str(cell.value).upper() == "FALSE":
-                cell.fill = false_fill
-    else:
-        st.warning(f"Column '{col}' not found in DataFrame. Skipping conditional formatting.")
-
-# Save the workbook with formatting
-wb.save(output_file)
+for col in write_report(df, output_file, sheet_name="Processed Report"):
+    st.warning(f"Column '{col}' not found in DataFrame. Skipping conditional formatting.")
 
 # Step 13: Visualizations
 st.subheader("Visualizations")
@@ -169,17 +142,30 @@ st.subheader("Visualizations")
 #Chart1
 
 # Ensure Tolerance Breach is a boolean before plotting
-df['Tolerance Breach'] = df['Tolerance Breach'].str.upper() == "TRUE"
+df['Tolerance Breach'] = df['Tolerance Breach'].fillna(False).astype(bool)
+
+
+# Work out the floating rate index and the fixed leg rate from Rec Rate / Pay Rate (see rate_parsing.py)
+df['Index'], df['Fixed Rate'] = detect_index(df['Rec Rate'], df['Pay Rate'])
+
+# Create Index_Maturity Key
+df['Maturity Year'] = df['Maturity Date'].dt.year.astype('Int64')
+df['Index_Maturity'] = join_labels(df['Index'], df['Maturity Year'].astype(str))
 
+# Keep these report dates in the history store
+if st.sidebar.button("Save these report dates to the history store"):
+    saved_dates = history.append(df, client, 'Report Date')
+    st.sidebar.success(f"Stored {len(saved_dates)} report dates for {client}")
 
-# Step 14: Visualization - Breaches grouped by Product Type and Ccy
-df['Product_Ccy'] = df['Product Sub Type'] + "_" + df['Ccy']  # Combine Product Type and Ccy
+# Step 14: Aggregate all breaches once into a cube over (date, Ccy, product, Index_Maturity, breach type).
+# Every chart below reads from the cube instead of re-filtering the trades.
+cube = build_breach_cube(df, 'Final Source Load Time', 'Ccy', value=excel_columns['W'])
 
 # Count Sensitivity Breach (TRUE) grouped by Product_Ccy
-sensitivity_breach_counts = df[df['Sensitivity Breach'] == "TRUE"]['Product_Ccy'].value_counts()
+sensitivity_breach_counts = product_ccy_counts(cube, 'Sensitivity')
 
 # Count Tolerance Breach (TRUE) grouped by Product_Ccy
-tolerance_breach_counts = df[df['Tolerance Breach'] == True]['Product_Ccy'].value_counts()
+tolerance_breach_counts = product_ccy_counts(cube, 'Tolerance')
 
 # Align indices of both counts (fill missing values with 0)
 all_product_ccy = sensitivity_breach_counts.index.union(tolerance_breach_counts.index)
@@ -232,12 +218,8 @@ axes[1].grid(True, linestyle='--', alpha=0.6)  # Grid background
 add_bar_labels(axes[1])  # Add labels inside bars
 
 # New third chart (Immediate Attention Required)
-# Filter for trades with both Sensitivity and Tolerance breaches
-immediate_attention_df = df[
-    (df['Sensitivity Breach'] == "TRUE") &
-    (df['Tolerance Breach'] == True)
-]
-immediate_attention_counts = immediate_attention_df['Product_Ccy'].value_counts()
+# Trades with both Sensitivity and Tolerance breaches
+immediate_attention_counts = product_ccy_counts(cube, 'Both')
 
 bars3 = axes[2].bar(
     immediate_attention_counts.index,
@@ -259,60 +241,22 @@ st.pyplot(fig)
 # Final Chart: Line Chart (Top 5 Index_Maturity breaches per currency)
 st.write("**Final Chart: Top 5 Index_Maturity Breaches per Currency (Time Series)**")
 
-# Filter out MTM Cross Currency Swap
-filtered_df = df[df['Product Sub Type'] != "MTM Cross Currency Swap"]
-
-# Create Index_Maturity Key
-# Ensure the 'Index' column exists
-if 'Index' not in filtered_df.columns:
-    # Add the 'Index' column using the get_index function
-    def get_index(row):
-        # Function to check if a value is a pure number (including negative numbers and percentages)
-        def is_numeric_rate(value):
-            if not isinstance(value, str):
-                return True  # Already a number (float/int)
-            # Remove '%', spaces, and check if it can be converted to a float
-            cleaned = value.replace('%', '').replace(' ', '')
-            return cleaned.replace('.', '', 1).replace('-', '', 1).isdigit()
-
-        rec_rate = row['Rec Rate']
-        pay_rate = row['Pay Rate']
-
-        # Check if Rec Rate is NOT numeric, meaning it's likely an index
-        if not is_numeric_rate(rec_rate):
-            return rec_rate  # Rec Rate is a text (e.g., an index like "DKKCIBOR6M")
-        # If Rec Rate is numeric, check Pay Rate
-        elif not is_numeric_rate(pay_rate):
-            return pay_rate  # Pay Rate is a text (index)
-        # If both are numeric, return None
-        return None
-
-    filtered_df['Index'] = filtered_df.apply(get_index, axis=1)
-
-# Create Index_Maturity Key
-filtered_df['Maturity Year'] = pd.to_datetime(filtered_df['Maturity Date'], errors='coerce').dt.year
-filtered_df['Index_Maturity'] = filtered_df['Index'] + "_" + filtered_df['Maturity Year'].astype(str)
-
-# Filter for Sensitivity Breach = TRUE
-sensitivity_breach_df = filtered_df[filtered_df['Sensitivity Breach'] == "TRUE"]
+# Sensitivity breaches, without MTM Cross Currency Swaps
+trend_cube = breach_rows(cube, 'Sensitivity', exclude_products=["MTM Cross Currency Swap"])
 
 # Group by Ccy and Index_Maturity to get top 5 breaches per currency
-top_5_per_currency = sensitivity_breach_df.groupby(['Ccy', 'Index_Maturity']).size().reset_index(name='Count')
-top_5_per_currency = top_5_per_currency.groupby('Ccy').apply(lambda x: x.nlargest(5, 'Count')).reset_index(drop=True)
-
-# Convert Final Source Load Time to datetime for plotting
-sensitivity_breach_df['Final Source Load Time'] = pd.to_datetime(sensitivity_breach_df['Final Source Load Time'], format='%d%m%Y')
+top_5_per_currency = trend_cube.groupby(['Ccy', 'Index_Maturity'], observed=True)['Count'].sum().reset_index(name='Count')
+top_5_per_currency = top_n_per_group(top_5_per_currency, 'Ccy', 'Count', n=5)
 
 # Plot line chart for each currency
 unique_ccys = top_5_per_currency['Ccy'].unique()
 for ccy in unique_ccys:
     st.write(f"**Currency: {ccy}**")
     top_5_indices = top_5_per_currency[top_5_per_currency['Ccy'] == ccy]['Index_Maturity'].tolist()
-    ccy_data = sensitivity_breach_df[
-        (sensitivity_breach_df['Ccy'] == ccy) &
-        (sensitivity_breach_df['Index_Maturity'].isin(top_5_indices))
-    ]
-    ccy_data = ccy_data.groupby(['Final Source Load Time', 'Index_Maturity']).size().unstack(fill_value=0)
+    ccy_data = daily_counts(trend_cube[
+        (trend_cube['Ccy'] == ccy) &
+        (trend_cube['Index_Maturity'].isin(top_5_indices))
+    ])
 
     fig4, ax4 = plt.subplots(figsize=(12, 6))
     for column in ccy_data.columns:
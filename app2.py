@@ -6,9 +6,20 @@ from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
 import numpy as np
 import streamlit as st
-import re
 from openpyxl.styles import Font
 
+from breach_cube import breach_rows, build_breach_cube, daily_counts, product_ccy_counts, top_n_per_group
+from breach_delta import breach_deltas, stored_tracker
+from breach_rules import sensitivity_breach, tolerance_breach
+from curve_comparison import TradeIndex, add_curve_diffs
+from excel_export import write_report
+from nav_history import IRS_DATASET, HistoryStore
+from nav_ingest import XLSX_PARSER_VERSION, load_irs_xlsx, unparseable_counts
+from nav_sql import EXAMPLE_QUERY, QueryError, query
+from parse_cache import MemoryCache, ParseCache
+from rate_parsing import detect_index
+from trade_schema import compact_trades, describe_memory_change, join_labels, memory_usage
+
 
 # Streamlit app title
 st.title("IRS Report Processor + Tolerance Break Trend Analytics")
@@ -26,236 +37,163 @@ if not uploaded_files:
 
 st.write(f"Uploaded {len(uploaded_files)} files for processing.")
 
-# Function to extract valuation date from row 11 of 'IRS' sheet
-def extract_valuation_date(file_path):
-    """
-    Extracts the Valuation Date from row 11 of the 'IRS' sheet in the Excel file.
-    Converts the extracted date to DDMMYYYY format.
-    """
-    try:
-        # Load workbook and explicitly select the "IRS" sheet
-        wb = load_workbook(file_path, data_only=True)
-
-        # Ensure "IRS" sheet exists before attempting to extract data
-        if "IRS" not in wb.sheetnames:
-            print(f"Warning: 'IRS' sheet not found in {file_path}")
-            return None
-
-        sheet = wb["IRS"]
-
-        # Extract full string from row 11, column 1
-        row_11_text = sheet.cell(row=11, column=1).value
-
-        if row_11_text:
-            # Look for "Valuation Date [DD-MMM-YYYY]"
-            match = re.search(r'Valuation Date \[(\d{2})-(\w{3})-(\d{4})\]', row_11_text)
-            if match:
-                day, month_str, year = match.groups()
-
-                # Convert month abbreviation to number
-                month_map = {
-                    "Jan": "01", "Feb": "02", "Mar": "03", "Apr": "04", "May": "05", "Jun": "06",
-                    "Jul": "07", "Aug": "08", "Sep": "09", "Oct": "10", "Nov": "11", "Dec": "12"
-                }
-                month = month_map.get(month_str, "00")
-
-                return f"{day}{month}{year}"  # Return date in DDMMYYYY format
-
-        return None  # Return None if no match is found
-
-    except Exception as e:
-        print(f"Error extracting valuation date from {file_path}: {e}")
-        return None
-
-# Initialize an empty list to store DataFrames
-all_data = []
-
-# Process each uploaded file, focusing only on the "IRS" sheet
-for uploaded_file in uploaded_files:
-    try:
-        # Extract the Valuation Date from row 11
-        valuation_date = extract_valuation_date(uploaded_file)
-
-        # Read the "IRS" sheet
-        raw_data = pd.read_excel(uploaded_file, sheet_name="IRS", header=[12, 13])
-
-        # Generate column names by merging row 13 and 14
-        new_columns = [
-            f"{str(upper).strip()}_{str(lower).strip()}" if str(upper) != 'nan' else str(lower).strip()
-            for upper, lower in zip(raw_data.columns.get_level_values(0), raw_data.columns.get_level_values(1))
-        ]
-        raw_data.columns = new_columns
+# Parsed and normalised uploads are kept in memory between reruns, so changing a widget
+# does not read the workbooks again. The memory cache lives as long as the app process.
+@st.cache_resource
+def get_memory_cache():
+    return MemoryCache()
 
-        # Drop potential blank rows
-        raw_data = raw_data.iloc[1:].reset_index(drop=True)
 
-        # Add a Report Date column
-        report_date = uploaded_file.name.split('-')[-1].split('.')[0] if '-' in uploaded_file.name else "Unknown Date"
-        raw_data["Report Date"] = report_date
+def normalise_reports(uploaded_files):
+    """Read every upload and build the normalised, client independent trade frame."""
+    # Parsed workbooks are cached on disk, so only new or changed reports are read again
+    cache = ParseCache()
 
-        # Add the Valuation Date column
-        raw_data["Valuation Date"] = valuation_date
+    # Initialize an empty list to store DataFrames
+    all_data = []
 
-        # Append processed data
-        all_data.append(raw_data)
+    # Process each uploaded file, focusing only on the "IRS" sheet
+    for uploaded_file in uploaded_files:
+        try:
+            all_data.append(load_irs_xlsx(uploaded_file, uploaded_file.name, cache))
 
-    except Exception as e:
-        st.error(f"Error processing {uploaded_file.name}: {e}")
-        continue
+        except Exception as e:
+            st.error(f"Error processing {uploaded_file.name}: {e}")
+            continue
 
-# Combine all DataFrames
-if all_data:
-    data = pd.concat(all_data, ignore_index=True)
-    st.success("All files processed successfully!")
-else:
-    st.error("No valid data found after processing.")
-    st.stop()
+    cache.evict()
 
-# Filter the DataFrame to only keep relevant columns
-filtered_columns = {
-    "GTID_Unnamed: 0_level_1": "Trade ID 1",
-    "Original GTID_Unnamed: 1_level_1": "Original GTID",
-    "Counterparty / Clearing Member_MV Base": "Counterparty MV Base",
-    "SS&C GlobeOp Source_MV Base": "SS&C MV Base",
-    "Instrument Sub Type_Unnamed: 6_level_1": "Product Sub Type",
-    "SS&C GlobeOp Source_IR DV01": "SS&C IR DV01",
-    "SS&C GlobeOp Trade Attributes_Trade Date": "Trade Date",
-    "SS&C GlobeOp Trade Attributes_Effective Date": "Effective Date",
-    "SS&C GlobeOp Trade Attributes_Maturity Date": "Maturity Date",
-    "SS&C GlobeOp Trade Attributes_Ccy": "Currency",
-    "SS&C GlobeOp Trade Attributes_Notional": "Notional",
-    "SS&C GlobeOp Trade Attributes_Rec Rate": "Rec Rate",
-    "SS&C GlobeOp Trade Attributes_Pay Rate": "Pay Rate",
-    "Counterparty/ Clearing Member_Final Source Load Time": "Final Source Load Time",
-    "Final Source vs Counterparty / Clearing Member_Difference in MV": "Difference in MV",
-    "Final Source vs Counterparty / Clearing Member_NAV Tolerance Analysis": "NAV Tolerance Analysis",
-    "Final Source vs Counterparty / Clearing Member_Diff. in MV/IR DV01 or Diff. in MV/IDV01": "Diff. in MV/IR DV01",
-    "Valuation Date": "Valuation Date",  # Add Valuation Date to filtered columns
-    "Third Party_Name": "BBG Curve 4.30pm futures Snap",
-    "Third Party2_Name": "LCH Curve w/ additional futs",
-    "Third Party_MV Base": "BBG REFERENCE Curve MV (4.30 Futs Snap)",
-    "Third Party2_MV Base": "LCH Test Curve MV"
-}
-
-# Ensure all columns in filtered_columns exist in the DataFrame
-existing_columns = [col for col in filtered_columns.keys() if col in data.columns]
-filtered_data = data[existing_columns].rename(columns=filtered_columns)
-
-# Drop rows with missing Trade ID 1
-filtered_data = filtered_data.dropna(subset=["Trade ID 1"])
-
-# Convert Valuation Date to DDMMYYYY format
-filtered_data['Valuation Date'] = pd.to_datetime(
-    filtered_data['Valuation Date'], format='%d%m%Y', errors='coerce'
-).dt.strftime('%d%m%Y')
-
-
-# Set up new columns
-filtered_data['Sensitivity Breach'] = None
-filtered_data['Tolerance Breach'] = None
+    # Combine all DataFrames
+    if all_data:
+        data = pd.concat(all_data, ignore_index=True)
+        st.success("All files processed successfully!")
+    else:
+        st.error("No valid data found after processing.")
+        st.stop()
 
-# Ask the user for the client name
-client = st.text_input("Please enter the client you are analyzing (e.g., ASGARD): ").strip()
+    # The reader keeps only the columns used here, already under these names (see report_layout.IRS_FIELDS)
+    filtered_data = data.drop(columns=['Report Date'])
 
-# Only proceed if the client is provided
-if client:
-    st.write(f"Processing data for client: **{client}**")
+    # The numeric columns are parsed as floats by the reader, keep the count of cells that were not numbers
+    filtered_data.attrs['unparseable'] = unparseable_counts(all_data)
 
-    if client.upper() == "ASGARD":
-        # Apply conditions for Tolerance Breach
-        filtered_data['Tolerance Breach'] = filtered_data['NAV Tolerance Analysis'].abs() > 1
-
-    # Apply Sensitivity Breach logic to ASGARD
-    ccy_list = ['USD', 'CAD', 'JPY', 'AUD', 'NZD', 'GBP', 'EUR', 'CHF', 'SEK', 'NOK']
-    filtered_data['Sensitivity Breach'] = filtered_data.apply(
-        lambda row: (
-            "TRUE" if (
-                row['Currency'] in ccy_list and
-                (
-                    (row['Product Sub Type'] == "Plain Vanilla" and abs(row['Diff. in MV/IR DV01']) > 2) or
-                    (row['Product Sub Type'] == "OIS" and abs(row['Diff. in MV/IR DV01']) > 1) or
-                    (row['Product Sub Type'] == "MTM Cross Currency Swap" and abs(row['Diff. in MV/IR DV01']) > 4)
-                )
-            ) else (
-                "TRUE" if (
-                    row['Currency'] not in ccy_list and
-                    (
-                        (row['Product Sub Type'] == "Plain Vanilla" and abs(row['Diff. in MV/IR DV01']) > 5) or
-                        (row['Product Sub Type'] == "OIS" and abs(row['Diff. in MV/IR DV01']) > 8) or
-                        (row['Product Sub Type'] == "MTM Cross Currency Swap" and abs(row['Diff. in MV/IR DV01']) > 9)
-                    )
-                ) else "FALSE"
-            )
-        ), axis=1
-    )
+    # Drop rows with missing Trade ID 1
+    filtered_data = filtered_data.dropna(subset=["Trade ID 1"])
+
+    # Set up new columns
+    filtered_data['Sensitivity Breach'] = None
+    filtered_data['Tolerance Breach'] = None
 
     # Create index column
     filtered_data["Index"] = None
     filtered_data["Index_Maturity"] = None
 
-    def get_index(row):
-        def is_numeric_rate(value):
-            if not isinstance(value, str):
-                return True
-            cleaned = value.replace('%', '').replace(' ', '')
-            return cleaned.replace('.', '', 1).replace('-', '', 1).isdigit()
+    # Work out the floating rate index and the fixed leg rate from Rec Rate / Pay Rate (see rate_parsing.py)
+    filtered_data['Index'], filtered_data['Fixed Rate'] = detect_index(filtered_data['Rec Rate'], filtered_data['Pay Rate'])
+
+    # Extract the year from Maturity Date (parsed by the reader) and add a "Maturity Year" column
+    filtered_data['Maturity Year'] = filtered_data['Maturity Date'].dt.year.astype('Int64')
 
-        rec_rate = row['Rec Rate']
-        pay_rate = row['Pay Rate']
+    # Create a new column for the Index and Maturity Year concatenation
+    filtered_data['Index_Maturity'] = join_labels(filtered_data['Index'], filtered_data['Maturity Year'].astype(str))
 
-        if not is_numeric_rate(rec_rate):
-            return rec_rate
-        elif not is_numeric_rate(pay_rate):
-            return pay_rate
-        return None
+    # BBG / LCH curve differences for every trade, used by the comparative analysis (see curve_comparison.py)
+    add_curve_diffs(filtered_data)
 
-    filtered_data['Index'] = filtered_data.apply(get_index, axis=1)
+    return filtered_data
 
-    # Extract the year from Maturity Date and add a "Maturity Year" column
-    filtered_data['Maturity Year'] = pd.to_datetime(filtered_data['Maturity Date'], errors='coerce').dt.year.astype('Int64')
 
-    # Create a new column for the Index and Maturity Year concatenation
-    filtered_data['Index_Maturity'] = filtered_data['Index'] + "_" + filtered_data['Maturity Year'].astype(str)
+memory_cache = get_memory_cache()
+upload_digests = [memory_cache.upload_digest(uploaded_file) for uploaded_file in uploaded_files]
+dataset_key = memory_cache.key(upload_digests, 'xlsx-upload', XLSX_PARSER_VERSION)
+filtered_data = memory_cache.get_or_build(dataset_key, lambda: normalise_reports(uploaded_files))
+
+for col, count in filtered_data.attrs.get('unparseable', {}).items():
+    if count:
+        st.warning(f"{count} value(s) in '{col}' are not numbers and were left empty.")
+
+
+# Trade ID 1 -> rows by date, built once per set of uploads. Rows are never dropped or reordered
+# after normalise_reports, so the positions stay valid for every rerun on the same uploads.
+@st.cache_resource(max_entries=4)
+def get_trade_index(dataset_key, _filtered_data):
+    return TradeIndex(_filtered_data['Trade ID 1'], _filtered_data['Valuation Date'])
+
+
+# Ask the user for the client name
+client = st.text_input("Please enter the client you are analyzing (e.g., ASGARD): ").strip()
+
+# Only proceed if the client is provided
+if client:
+    st.write(f"Processing data for client: **{client}**")
+
+    # Apply the client's Tolerance and Sensitivity Breach thresholds (see breach_rules.py)
+    tolerance = tolerance_breach(filtered_data['NAV Tolerance Analysis'], client)
+    if tolerance is not None:
+        filtered_data['Tolerance Breach'] = tolerance
+
+    filtered_data['Sensitivity Breach'] = sensitivity_breach(
+        filtered_data['Currency'], filtered_data['Product Sub Type'], filtered_data['Diff. in MV/IR DV01'], client
+    )
+
+    # Cast to the compact schema (categoricals, real booleans, datetime64, float32) before export and charts
+    memory_before = memory_usage(filtered_data)
+    compact_trades(filtered_data)
+    st.write(describe_memory_change(memory_before, memory_usage(filtered_data)))
+
+    # History store of the processed valuation dates (see nav_history.py)
+    history = HistoryStore(dataset=IRS_DATASET)
+
+    # Day-over-day changes: which breaches are new, persisting or resolved since the previous valuation date.
+    # The first valuation date is compared with the last one stored before it.
+    st.subheader("Breach Changes by Valuation Date")
+    for breach_column in ["Sensitivity Breach", "Tolerance Breach"]:
+        tracker = stored_tracker(history, client, filtered_data['Valuation Date'].min(), breach_column)
+        filtered_data[f'{breach_column} Status'], filtered_data[f'{breach_column} Streak'], delta_summary = breach_deltas(
+            filtered_data, 'Valuation Date', breach_column, tracker=tracker
+        )
+        st.write(f"**{breach_column}**")
+        st.write(delta_summary)
 
     st.write(filtered_data)
 
-    # Save the updated DataFrame to an Excel file
+    # Save the updated DataFrame to an Excel file, with TRUE/FALSE highlighted by conditional formatting
     output_file = "Processed_ASGARD_Report_with_Breaches.xlsx"
-    filtered_data.to_excel(output_file, index=False, engine='openpyxl', sheet_name="Processed Report")
-
-    # Apply conditional formatting for TRUE/FALSE
-    wb = load_workbook(output_file)
-    ws = wb["Processed Report"]
-    filtered_data['Sensitivity Breach'] = filtered_data['Sensitivity Breach'].astype(str)
-    filtered_data['Tolerance Breach'] = filtered_data['Tolerance Breach'].astype(str)
-
-    columns_to_format = ["Sensitivity Breach", "Tolerance Breach"]
-    true_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    false_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-
-    for col in columns_to_format:
-        if col in filtered_data.columns:
-            col_idx = filtered_data.columns.get_loc(col) + 1
-            for row in range(2, len(filtered_data) + 2):
-                cell = ws.cell(row=row, column=col_idx)
-                if str(cell.value).upper() == "TRUE":
-                    cell.fill = true_fill
-                elif str(cell.value).upper() == "FALSE":
-                    cell.fill = false_fill
-        else:
-            st.warning(f"Warning: Column '{col}' not found in DataFrame. Skipping conditional formatting.")
-
-    wb.save(output_file)
+    for col in write_report(filtered_data, output_file, sheet_name="Processed Report"):
+        st.warning(f"Warning: Column '{col}' not found in DataFrame. Skipping conditional formatting.")
     st.write(f"Conditional formatting applied and saved to: {output_file}")
 
     # Ensure Tolerance Breach is a boolean before plotting
-    filtered_data['Tolerance Breach'] = filtered_data['Tolerance Breach'].str.upper() == "TRUE"
+    filtered_data['Tolerance Breach'] = filtered_data['Tolerance Breach'].fillna(False).astype(bool)
+
+    # Keep these valuation dates in the history store, and optionally draw the charts over stored history
+    if st.sidebar.button("Save these valuation dates to the history store"):
+        saved_dates = history.append(filtered_data, client, 'Valuation Date')
+        st.sidebar.success(f"Stored {len(saved_dates)} valuation dates for {client.upper()}")
+
+    trend_data = filtered_data
+    stored_dates = history.dates(client)
+    if stored_dates and st.sidebar.checkbox("Include stored history in the charts"):
+        trend_from = st.sidebar.date_input(
+            "History from", value=stored_dates[0], min_value=stored_dates[0], max_value=stored_dates[-1]
+        )
+        # Only the partitions from that date on, and only the columns the cube needs, are read
+        trend_columns = ['Valuation Date', 'Currency', 'Product Sub Type', 'Index_Maturity',
+                         'Sensitivity Breach', 'Tolerance Breach', 'Difference in MV']
+        stored = history.read(client, start=trend_from, columns=trend_columns)
+        if stored is not None:
+            # Uploaded dates replace the stored copies of the same dates
+            stored = stored[~stored['Valuation Date'].isin(filtered_data['Valuation Date'].unique())]
+            trend_data = pd.concat([stored, filtered_data[trend_columns]], ignore_index=True)
+            st.write(f"Charts include stored history from {trend_from}: {trend_data['Valuation Date'].nunique()} valuation dates.")
+
+    # Aggregate all breaches once into a cube over (date, Ccy, product, Index_Maturity, breach type).
+    # Every chart below reads from the cube instead of re-filtering the trades.
+    cube = build_breach_cube(trend_data, 'Valuation Date', 'Currency', value='Difference in MV')
 
     # Visualization - Breaches grouped by Product Type and Ccy
-    filtered_data['Product_Ccy'] = filtered_data['Product Sub Type'] + "_" + filtered_data['Currency']
-
-    sensitivity_breach_counts = filtered_data[filtered_data['Sensitivity Breach'] == "TRUE"]['Product_Ccy'].value_counts()
-    tolerance_breach_counts = filtered_data[filtered_data['Tolerance Breach'] == True]['Product_Ccy'].value_counts()
+    sensitivity_breach_counts = product_ccy_counts(cube, 'Sensitivity')
+    tolerance_breach_counts = product_ccy_counts(cube, 'Tolerance')
 
     all_product_ccy = sensitivity_breach_counts.index.union(tolerance_breach_counts.index)
     sensitivity_breach_counts = sensitivity_breach_counts.reindex(all_product_ccy, fill_value=0)
@@ -296,11 +234,7 @@ if client:
     add_bar_labels(axes[1])
 
     # Immediate Attention Required Chart
-    immediate_attention_df = filtered_data[
-        (filtered_data['Sensitivity Breach'] == "TRUE") &
-        (filtered_data['Tolerance Breach'] == True)
-    ]
-    immediate_attention_counts = immediate_attention_df['Product_Ccy'].value_counts()
+    immediate_attention_counts = product_ccy_counts(cube, 'Both')
     bars3 = axes[2].bar(immediate_attention_counts.index, immediate_attention_counts, color='darkred', edgecolor='black')
     axes[2].set_title("Breaks Requiring Immediate Attention (Both Sensitivity & Tolerance Breaches)", fontsize=14)
     axes[2].set_ylabel("Count of Critical Breaches", fontsize=12)
@@ -312,29 +246,22 @@ if client:
     st.pyplot(fig)
 
     # Trend Analysis
-    filtered_df = filtered_data[
-        (filtered_data['Sensitivity Breach'] == "TRUE") &
-        (filtered_data['Product Sub Type'] != "MTM Cross Currency Swap")
-    ]
-    breach_counts = filtered_df.groupby(['Currency', 'Index_Maturity']).size().reset_index(name='Breach Count')
-    top_5_per_currency = breach_counts.groupby('Currency').apply(lambda x: x.nlargest(5, 'Breach Count')).reset_index(drop=True)
+    trend_cube = breach_rows(cube, 'Sensitivity', exclude_products=["MTM Cross Currency Swap"])
+    breach_counts = trend_cube.groupby(['Ccy', 'Index_Maturity'], observed=True)['Count'].sum().reset_index(name='Breach Count')
+    top_5_per_currency = top_n_per_group(breach_counts, 'Ccy', 'Breach Count', n=5)
 
-    filtered_data['Plot Date'] = pd.to_datetime(filtered_data['Valuation Date'], format='%d%m%Y')
-
-    unique_ccys = top_5_per_currency['Currency'].unique()
+    unique_ccys = top_5_per_currency['Ccy'].unique()
     fig, axes = plt.subplots(len(unique_ccys), 1, figsize=(15, 5 * len(unique_ccys)), sharex=True)
 
     if len(unique_ccys) == 1:
         axes = [axes]
 
     for ax, ccy in zip(axes, unique_ccys):
-        top_5_indices = top_5_per_currency[top_5_per_currency['Currency'] == ccy]['Index_Maturity'].tolist()
-        ccy_data = filtered_data[
-            (filtered_data['Currency'] == ccy) &
-            (filtered_data['Index_Maturity'].isin(top_5_indices)) &
-            (filtered_data['Sensitivity Breach'] == "TRUE") &
-            (filtered_data['Product Sub Type'] != "MTM Cross Currency Swap")
-        ].groupby(['Plot Date', 'Index_Maturity']).size().unstack(fill_value=0)
+        top_5_indices = top_5_per_currency[top_5_per_currency['Ccy'] == ccy]['Index_Maturity'].tolist()
+        ccy_data = daily_counts(trend_cube[
+            (trend_cube['Ccy'] == ccy) &
+            (trend_cube['Index_Maturity'].isin(top_5_indices))
+        ])
 
         for column in ccy_data.columns:
             ax.plot(ccy_data.index, ccy_data[column], marker='o', label=column)
@@ -351,16 +278,12 @@ if client:
 
     # Filter the data for Sensitivity Breaches and exclude MTM Cross Currency Swap
     filtered_df = filtered_data[
-        (filtered_data['Sensitivity Breach'] == "TRUE") &
+        filtered_data['Sensitivity Breach'] &
         (filtered_data['Product Sub Type'] != "MTM Cross Currency Swap")
         ]
 
-    # Group by Currency and Index_Maturity to get breach counts
-    breach_counts = filtered_df.groupby(['Currency', 'Index_Maturity']).size().reset_index(name='Breach Count')
-
-    # Get the top 5 Index Maturities per Currency
-    top_5_per_currency = breach_counts.groupby('Currency').apply(lambda x: x.nlargest(5, 'Breach Count')).reset_index(
-        drop=True)
+    # Top 5 Index Maturities per Currency, as in the trend chart above
+    top_5_per_currency = top_5_per_currency.rename(columns={'Ccy': 'Currency'})
 
     # Debug: Print top_5_per_currency to verify data
     st.write("Top 5 Index Maturities per Currency:")
@@ -429,42 +352,18 @@ if client:
     # Split the input into a list of Trade IDs
     selected_trade_ids = [tid.strip() for tid in trade_ids_input.split(",")] if trade_ids_input else []
 
-    # Filter the data based on user selections
-    filtered_df2 = filtered_df[
-        (filtered_df['Product Sub Type'] == selected_product_sub_type) &
-        (filtered_df['Index'] == selected_index) &
-        (filtered_df['Trade ID 1'].isin(selected_trade_ids))
+    # Look up the selected trades in the trade index, then apply the other selections to just their rows
+    trade_index = get_trade_index(dataset_key, filtered_data)
+    filtered_df2 = filtered_data.iloc[trade_index.positions(selected_trade_ids)]
+    filtered_df2 = filtered_df2[
+        filtered_df2['Sensitivity Breach'] &
+        (filtered_df2['Product Sub Type'] != "MTM Cross Currency Swap") &
+        (filtered_df2['Product Sub Type'] == selected_product_sub_type) &
+        (filtered_df2['Index'] == selected_index)
         ]
 
-    # Convert Valuation Date to datetime for proper time series plotting
-    filtered_df2['Valuation Date'] = pd.to_datetime(filtered_df2['Valuation Date'], format='%d%m%Y')
-
     ## Perform comparative analysis
-
-    # Ensure columns are numeric
-    filtered_df2['BBG REFERENCE Curve MV (4.30 Futs Snap)'] = filtered_df2[
-        'BBG REFERENCE Curve MV (4.30 Futs Snap)'].replace({'TRUE': 1, 'FALSE': 0}).astype(float)
-    filtered_df2['LCH Test Curve MV'] = pd.to_numeric(filtered_df2['LCH Test Curve MV'], errors='coerce')
-    filtered_df2['BBG REFERENCE Curve MV (4.30 Futs Snap)'] = pd.to_numeric(
-        filtered_df2['BBG REFERENCE Curve MV (4.30 Futs Snap)'], errors='coerce')
-
-    # Ensure denominator (SS&C IR DV01) is non-zero to prevent division errors
-    filtered_df2['SS&C IR DV01'] = filtered_df2['SS&C IR DV01'].replace(0, np.nan)
-
-    # Calculate new basis points differences
-    filtered_df2['BBG REFERENCE Curve MV Diff'] = (
-            (filtered_df2['BBG REFERENCE Curve MV (4.30 Futs Snap)'] - filtered_df2['Counterparty MV Base']) /
-            filtered_df2['SS&C IR DV01']
-    )
-
-    filtered_df2['LCH Test Curve MV Diff'] = (
-            (filtered_df2['LCH Test Curve MV'] - filtered_df2['Counterparty MV Base']) /
-            filtered_df2['SS&C IR DV01']
-    )
-
-    # Ensure the new columns are numeric
-    filtered_df2['LCH Test Curve MV Diff'] = pd.to_numeric(filtered_df2['LCH Test Curve MV Diff'],
-                                                           errors='coerce').fillna(0)
+    # The BBG REFERENCE and LCH Test curve differences were computed for every trade at load time
 
     # Group by Valuation Date and calculate averages
     time_series_data = filtered_df2.groupby('Valuation Date').agg({
@@ -633,7 +532,8 @@ if client:
 
     row_offset = 2  # Start after header
     for val_date in valuation_dates:
-        ws.cell(row=row_offset, column=1, value=str(val_date)).font = bold_font
+        label = pd.Timestamp(val_date).strftime('%d%m%Y') if pd.notna(val_date) else ""
+        ws.cell(row=row_offset, column=1, value=label).font = bold_font
         row_offset += len(exceptions_report[exceptions_report["Valuation Date"] == val_date]) + 1  # Leave a blank row
 
     # Save workbook
@@ -662,4 +562,14 @@ if client:
             data=file,
             file_name=exceptions_output_file,
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
\ No newline at end of file
+        )
+    # Ad-hoc SQL over the stored history and the reports uploaded here (see nav_sql.py)
+    st.subheader("SQL Query")
+    st.write("Tables: `irs` and `derivatives` hold the stored history (with `client` and `date` columns), "
+             "`trades` holds the reports uploaded in this session. Quote column names that contain spaces.")
+    sql = st.text_area("Query", value=EXAMPLE_QUERY, height=220)
+    if st.button("Run Query"):
+        try:
+            st.dataframe(query(sql, frames={'trades': filtered_data}))
+        except QueryError as e:
+            st.error(f"Query failed: {e}")
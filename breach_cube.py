@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# Breach types held in the cube. 'Both' is a trade with a Sensitivity and a Tolerance Breach
+BREACH_TYPES = ['Sensitivity', 'Tolerance', 'Both']
+
+# Cube dimensions, whatever the source columns are called in each processor
+CUBE_DIMENSIONS = ['Date', 'Ccy', 'Product Sub Type', 'Index_Maturity']
+
+
+def build_breach_cube(df, date, ccy, product='Product Sub Type', index_maturity='Index_Maturity', value=None):
+    """
+    Aggregate the trade frame into a breach cube in a single groupby pass.
+    Returns one row per (Date, Ccy, Product Sub Type, Index_Maturity, Breach Type) with at least
+    one breach: the number of breaching trades in 'Count' and, if `value` is given, the sum of that
+    column over those trades in 'Sum'. Missing dimension values are kept as their own group.
+    """
+    sensitivity = np.asarray(df['Sensitivity Breach'].fillna(False), dtype=bool)
+    tolerance = np.asarray(df['Tolerance Breach'].fillna(False), dtype=bool)
+    flags = {'Sensitivity': sensitivity, 'Tolerance': tolerance, 'Both': sensitivity & tolerance}
+
+    # Trades without any breach never reach the groupby
+    breached = sensitivity | tolerance
+    columns = {}
+    amounts = None if value is None else pd.to_numeric(df[value], errors='coerce').to_numpy(dtype=float)[breached]
+    for breach_type, flag in flags.items():
+        columns[breach_type] = flag[breached].astype(np.int64)
+        if amounts is not None:
+            columns[f'{breach_type} Sum'] = np.where(flag[breached], amounts, 0.0)
+
+    keys = df.loc[breached, [date, ccy, product, index_maturity]]
+    keys.columns = CUBE_DIMENSIONS
+    totals = pd.DataFrame(columns, index=keys.index).groupby(
+        [keys[dimension] for dimension in CUBE_DIMENSIONS], observed=True, dropna=False
+    ).sum()
+
+    # Long format, one block of rows per breach type
+    parts = []
+    for breach_type in BREACH_TYPES:
+        part = totals[[breach_type]].rename(columns={breach_type: 'Count'})
+        if amounts is not None:
+            part['Sum'] = totals[f'{breach_type} Sum']
+        part = part[part['Count'] > 0].reset_index()
+        part['Breach Type'] = breach_type
+        parts.append(part)
+
+    cube = pd.concat(parts, ignore_index=True)
+    cube['Breach Type'] = pd.Categorical(cube['Breach Type'], categories=BREACH_TYPES)
+    return cube[CUBE_DIMENSIONS + ['Breach Type'] + [col for col in ('Count', 'Sum') if col in cube.columns]]
+
+
+def breach_rows(cube, breach_type, exclude_products=()):
+    """Cube rows for one breach type, optionally without some product sub types."""
+    rows = cube['Breach Type'] == breach_type
+    if exclude_products:
+        rows &= ~cube['Product Sub Type'].isin(exclude_products)
+    return cube[rows]
+
+
+def product_ccy_counts(cube, breach_type):
+    """
+    Breaches per "<Product Sub Type>_<Ccy>" label, largest first, like value_counts on the
+    Product_Ccy column. Rows missing either label are left out.
+    """
+    counts = breach_rows(cube, breach_type).groupby(['Product Sub Type', 'Ccy'], observed=True)['Count'].sum()
+    counts = counts[counts > 0]
+    labels = pd.Index([f"{product}_{ccy}" for product, ccy in counts.index], name='Product_Ccy')
+    counts = pd.Series(counts.to_numpy(), index=labels, name='count').groupby(level=0).sum()
+    return counts.sort_values(ascending=False, kind='stable')
+
+
+def daily_counts(rows, column='Index_Maturity'):
+    """Breach counts of some cube rows with the dates down the index and one column per value of `column`."""
+    return rows.groupby(['Date', column], observed=True)['Count'].sum().unstack(fill_value=0)
+
+
+def top_n_per_group(frame, group, value, n=5):
+    """
+    The n rows with the largest `value` in each `group`, without a Python call per group.
+    Same rows as groupby(group).apply(lambda x: x.nlargest(n, value)): groups in sorted order,
+    largest first, ties always kept in their original row order. Rows with a missing group or
+    value are dropped.
+    """
+    frame = frame[frame[group].notna()]
+    # A multi-key sort is stable, so rows with equal values keep their original order
+    ranked = frame.sort_values([group, value], ascending=[True, False])
+    ranked = ranked[ranked[value].notna()]
+    return ranked[ranked.groupby(group, observed=True).cumcount() < n].reset_index(drop=True)
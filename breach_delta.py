@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+# Status of a trade against the previous valuation date
+BREACH_STATUSES = ['New', 'Persisting', 'Resolved']
+
+
+def _lookup(sorted_keys, keys):
+    """Positions of `keys` in the sorted array `sorted_keys`, and whether each one was found there."""
+    positions = np.searchsorted(sorted_keys, keys)
+    found = np.zeros(len(keys), dtype=bool)
+    inside = positions < len(sorted_keys)
+    found[inside] = sorted_keys[positions[inside]] == keys[inside]
+    return np.where(found, positions, 0), found
+
+
+def _take(values, positions, found, default):
+    """values[positions] where found, else default. Safe when values is empty."""
+    if not len(values):
+        return np.full(len(positions), default, dtype=np.int64)
+    return np.where(found, values[positions], default)
+
+
+class BreachTracker:
+    """
+    Follows the breaching trades from one valuation date to the next.
+    Only the previous day's breaching trades (sorted by trade id) and their streaks are kept,
+    so adding a day costs O(trades in that day) whatever the length of the history.
+    """
+
+    def __init__(self):
+        self.date = None
+        self.trade_ids = np.array([], dtype=str)  # Breaching on self.date, sorted
+        self.streaks = np.array([], dtype=np.int64)  # Consecutive days each of those has breached
+
+    def resume(self, date, trade_ids, streaks):
+        """Carry on from a day processed earlier: the trades breaching on `date` and their streaks."""
+        trade_ids = np.asarray(trade_ids).astype(str)
+        self.trade_ids, positions = np.unique(trade_ids, return_index=True)
+        self.streaks = np.asarray(streaks, dtype=np.int64)[positions]
+        self.date = date
+
+    def add_day(self, date, trade_ids, breached):
+        """
+        Move on to the next valuation date. `trade_ids` and `breached` are that day's rows.
+        Returns (status, streak, resolved): the status ('New'/'Persisting'/'Resolved'/None) and breach
+        streak of every row, plus the ids of trades that breached the previous day and not this one,
+        including trades that are no longer in the report.
+        """
+        if self.date is not None and date <= self.date:
+            raise ValueError(f"Valuation dates must be added in order: {date} after {self.date}")
+
+        trade_ids = np.asarray(trade_ids).astype(str)  # Fixed width strings search much faster than objects
+        breached = np.asarray(breached, dtype=bool)
+
+        # Today's breaching trades, matched against yesterday's with a sorted search
+        today = np.unique(trade_ids[breached])
+        previous_positions, persisting = _lookup(self.trade_ids, today)
+        streaks = _take(self.streaks, previous_positions, persisting, 0) + 1
+        resolved = self.trade_ids[~_lookup(today, self.trade_ids)[1]]
+
+        # Map the trade level results back to the rows
+        today_positions, row_breached = _lookup(today, trade_ids)
+        row_breached_before = _lookup(self.trade_ids, trade_ids)[1]
+        status = np.full(len(trade_ids), None, dtype=object)
+        status[row_breached & ~row_breached_before] = 'New'
+        status[row_breached & row_breached_before] = 'Persisting'
+        status[~row_breached & row_breached_before] = 'Resolved'
+        streak = _take(streaks, today_positions, row_breached, 0)
+
+        self.date, self.trade_ids, self.streaks = date, today, streaks.astype(np.int64)
+        return status, streak, resolved
+
+
+def stored_tracker(history, client, before, breach_column, key='Trade ID 1'):
+    """
+    A tracker resumed from the last day in `history` (a nav_history.HistoryStore) before `before`,
+    so a run's first date is compared with what was stored rather than reported as all 'New'.
+    Returns None when nothing earlier is stored.
+    """
+    dates = [date for date in history.dates(client) if date < pd.Timestamp(before)]
+    if not dates:
+        return None
+    day = history.read(client, start=dates[-1], end=dates[-1])
+    breached = day[breach_column].fillna(False).to_numpy(dtype=bool)
+    # Days stored before streaks were kept count as the first day of the breach
+    streak_column = f'{breach_column} Streak'
+    streaks = day[streak_column].to_numpy()[breached] if streak_column in day.columns else np.ones(breached.sum())
+
+    tracker = BreachTracker()
+    tracker.resume(dates[-1], day[key].to_numpy()[breached], streaks)
+    return tracker
+
+
+def breach_deltas(df, date_column, breach_column, key='Trade ID 1', tracker=None):
+    """
+    Day-over-day status of one breach flag over a multi-day frame.
+    Returns (status, streak, summary): a status and a breach streak Series aligned with df, and a
+    table of New/Persisting/Resolved trade counts per date. Pass the tracker from an earlier call to
+    carry on from the last date it saw, otherwise the first date's breaches are all 'New'.
+    """
+    tracker = tracker or BreachTracker()
+    status = np.full(len(df), None, dtype=object)
+    streak = np.zeros(len(df), dtype=np.int64)
+    trade_ids = df[key].to_numpy()
+    breached = df[breach_column].fillna(False).to_numpy(dtype=bool)
+
+    counts = {}
+    for date, rows in sorted(df.groupby(date_column, observed=True).indices.items()):
+        day_status, day_streak, resolved = tracker.add_day(date, trade_ids[rows], breached[rows])
+        status[rows] = day_status
+        streak[rows] = day_streak
+        counts[date] = {
+            'New': int((tracker.streaks == 1).sum()),
+            'Persisting': int((tracker.streaks > 1).sum()),
+            'Resolved': len(resolved),
+        }
+
+    summary = pd.DataFrame.from_dict(counts, orient='index', columns=BREACH_STATUSES)
+    summary.index.name = date_column
+    return (
+        pd.Series(pd.Categorical(status, categories=BREACH_STATUSES), index=df.index),
+        pd.Series(streak, index=df.index),
+        summary,
+    )
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# Currencies in the G10 tier, everything else falls in the 'Other' tier
+G10_CURRENCIES = ['USD', 'CAD', 'JPY', 'AUD', 'NZD', 'GBP', 'EUR', 'CHF', 'SEK', 'NOK']
+CURRENCY_TIERS = ['G10', 'Other']
+
+# Applies to every client unless a client specific row overrides it
+ALL_CLIENTS = '*'
+
+# (client, currency tier, product sub type) -> a Sensitivity Breach is |Diff. in MV/IR DV01| above this many bps.
+# Product sub types with no row here never breach.
+SENSITIVITY_THRESHOLDS = {
+    (ALL_CLIENTS, 'G10', 'Plain Vanilla'): 2,
+    (ALL_CLIENTS, 'G10', 'OIS'): 1,
+    (ALL_CLIENTS, 'G10', 'MTM Cross Currency Swap'): 4,
+    (ALL_CLIENTS, 'Other', 'Plain Vanilla'): 5,
+    (ALL_CLIENTS, 'Other', 'OIS'): 8,
+    (ALL_CLIENTS, 'Other', 'MTM Cross Currency Swap'): 9,
+}
+
+# client -> a Tolerance Breach is |NAV break| above this many bps. Clients not listed get no tolerance check.
+TOLERANCE_THRESHOLDS = {
+    'ASGARD': 1,
+}
+
+
+def client_sensitivity_thresholds(client):
+    """Return {(tier, product sub type): threshold} for a client, with its own rows overriding the defaults."""
+    client = (client or '').strip().upper()
+    thresholds = {}
+    for source in (ALL_CLIENTS, client):
+        for (rule_client, tier, product), threshold in SENSITIVITY_THRESHOLDS.items():
+            if rule_client == source:
+                thresholds[(tier, product)] = threshold
+    return thresholds
+
+
+def sensitivity_breach(ccy, product_sub_type, sensitivity, client=None):
+    """
+    Vectorized Sensitivity Breach check over whole columns.
+    Returns a "TRUE"/"FALSE" Series aligned with `sensitivity`.
+    """
+    thresholds = client_sensitivity_thresholds(client)
+    products = sorted({product for _, product in thresholds})
+
+    # Threshold matrix indexed by [tier, product]; the extra last column (inf) catches unknown products
+    matrix = np.full((len(CURRENCY_TIERS), len(products) + 1), np.inf)
+    for (tier, product), threshold in thresholds.items():
+        matrix[CURRENCY_TIERS.index(tier), products.index(product)] = threshold
+
+    tier_codes = np.where(pd.Series(ccy).isin(G10_CURRENCIES).to_numpy(), 0, 1)
+    product_codes = pd.Categorical(product_sub_type, categories=products).codes  # -1 = not in the table
+    row_thresholds = matrix[tier_codes, product_codes]
+
+    values = pd.to_numeric(pd.Series(sensitivity), errors='coerce').to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        breached = np.abs(values) > row_thresholds  # NaN never breaches
+
+    # Indexing a two element array is much cheaper than np.where building millions of strings
+    flags = np.array(["FALSE", "TRUE"], dtype=object)[breached.view(np.int8)]
+    return pd.Series(flags, index=getattr(sensitivity, 'index', None))
+
+
+def tolerance_breach(nav_break, client=None):
+    """
+    Vectorized Tolerance Breach check. Returns a boolean Series, or None when the
+    client has no tolerance threshold configured.
+    """
+    threshold = TOLERANCE_THRESHOLDS.get((client or '').strip().upper())
+    if threshold is None:
+        return None
+    return nav_break.abs() > threshold
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+# Third party curve MVs compared against the counterparty MV, in DV01 terms
+BBG_CURVE_MV = 'BBG REFERENCE Curve MV (4.30 Futs Snap)'
+LCH_CURVE_MV = 'LCH Test Curve MV'
+BBG_CURVE_DIFF = 'BBG REFERENCE Curve MV Diff'
+LCH_CURVE_DIFF = 'LCH Test Curve MV Diff'
+
+
+def add_curve_diffs(df):
+    """
+    Add the BBG and LCH curve MV differences ((curve MV - Counterparty MV Base) / SS&C IR DV01)
+    for every row, in place. A zero DV01 gives NaN; a missing LCH difference counts as 0.
+    The source columns are left as they are.
+    """
+    bbg_mv = pd.to_numeric(df[BBG_CURVE_MV], errors='coerce')
+    lch_mv = pd.to_numeric(df[LCH_CURVE_MV], errors='coerce')
+    counterparty_mv = pd.to_numeric(df['Counterparty MV Base'], errors='coerce')
+    dv01 = pd.to_numeric(df['SS&C IR DV01'], errors='coerce').replace(0, np.nan)
+
+    df[BBG_CURVE_DIFF] = (bbg_mv - counterparty_mv) / dv01
+    df[LCH_CURVE_DIFF] = ((lch_mv - counterparty_mv) / dv01).fillna(0)
+    return df
+
+
+class TradeIndex:
+    """
+    Trade ID 1 -> row positions, ordered by date, built once per dataset.
+    Rows are sorted by (trade, date) once; looking up a handful of trades is then a few
+    array slices instead of an isin scan over every row.
+    """
+
+    def __init__(self, trade_ids, dates):
+        codes, self.trade_ids = pd.factorize(pd.Series(trade_ids).astype(str))
+        dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        self.order = np.lexsort((dates, codes))
+        # Rows of trade i are order[bounds[i]:bounds[i + 1]]
+        self.bounds = np.searchsorted(codes[self.order], np.arange(len(self.trade_ids) + 1))
+
+    def positions(self, trade_ids):
+        """Row positions of the given trades (unknown ids are ignored), each trade's rows in date order."""
+        codes = self.trade_ids.get_indexer(pd.Index([str(trade_id) for trade_id in trade_ids]))
+        slices = [self.order[self.bounds[code]:self.bounds[code + 1]] for code in codes if code >= 0]
+        return np.concatenate(slices) if slices else np.array([], dtype=np.int64)
@@ -0,0 +1,80 @@
+import numpy as np
+import xlsxwriter
+from xlsxwriter.utility import xl_rowcol_to_cell
+
+# Breach flag columns highlighted in the processed report
+FLAG_COLUMNS = ["Sensitivity Breach", "Tolerance Breach"]
+TRUE_COLOR = "#FFC7CE"  # Red for TRUE
+FALSE_COLOR = "#C6EFCE"  # Green for FALSE
+
+# Same cell formats pandas' to_excel used
+DATETIME_FORMAT = "yyyy-mm-dd hh:mm:ss"
+HEADER_FORMAT = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+
+# Rows converted and written at a time
+WRITE_CHUNK_ROWS = 10000
+
+
+def _column_values(values):
+    """
+    Python values for one column: NaN/NaT/<NA> become None (a blank cell), categoricals their labels.
+    float32 values are written as their shortest decimal, so a -12.21 held in float32 is -12.21 in
+    the workbook rather than -12.210000038146973.
+    """
+    if values.dtype == np.float32:
+        values = values.astype(str).astype(np.float64)
+    values = values.astype(object)
+    return values.where(values.notna(), None).tolist()
+
+
+def _flag_rule(cell, flag):
+    # Matches real booleans and "TRUE"/"FALSE" text alike. The ISLOGICAL check stops
+    # Excel treating blank cells as FALSE.
+    return f'=IF(ISLOGICAL({cell}),{cell}={flag},{cell}="{flag}")'
+
+
+def write_report(df, output_file, sheet_name="Processed Report", flag_columns=FLAG_COLUMNS):
+    """
+    Write a frame to an .xlsx file in a single streamed pass.
+    Rows are converted in slices of WRITE_CHUNK_ROWS and flushed to disk as they are written
+    (xlsxwriter's constant_memory mode), and the TRUE/FALSE highlighting of the flag columns is
+    stored as sheet level conditional formatting rather than a fill on every cell.
+    Returns the flag columns that were not found in the frame.
+    """
+    wb = xlsxwriter.Workbook(output_file, {
+        'constant_memory': True,
+        'default_date_format': DATETIME_FORMAT,
+        'nan_inf_to_errors': True,
+        'strings_to_urls': False,
+    })
+    ws = wb.add_worksheet(sheet_name)
+
+    header_format = wb.add_format(HEADER_FORMAT)
+    ws.write_row(0, 0, [str(col) for col in df.columns], header_format)
+
+    # constant_memory only allows writing forwards, so go row by row. Rows are converted to Python
+    # values a slice at a time, so memory stays bounded whatever the length of the frame
+    for start in range(0, len(df), WRITE_CHUNK_ROWS):
+        chunk = df.iloc[start:start + WRITE_CHUNK_ROWS]
+        columns = [_column_values(chunk.iloc[:, i]) for i in range(chunk.shape[1])]
+        for row_idx, row in enumerate(zip(*columns), start=start + 1):
+            ws.write_row(row_idx, 0, row)
+
+    missing = [col for col in flag_columns if col not in df.columns]
+    if len(df):
+        true_format = wb.add_format({'bg_color': TRUE_COLOR})
+        false_format = wb.add_format({'bg_color': FALSE_COLOR})
+        for col in flag_columns:
+            if col in missing:
+                continue
+            col_idx = df.columns.get_loc(col)
+            first_cell = xl_rowcol_to_cell(1, col_idx)
+            for flag, cell_format in (("TRUE", true_format), ("FALSE", false_format)):
+                ws.conditional_format(1, col_idx, len(df), col_idx, {
+                    'type': 'formula',
+                    'criteria': _flag_rule(first_cell, flag),
+                    'format': cell_format,
+                })
+
+    wb.close()
+    return missing
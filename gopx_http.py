@@ -0,0 +1,300 @@
+import os
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from portal_jobs import (DEFAULT_WORKERS, PAGE_TIMEOUT, REPORT_TIMEOUT, PortalAlert, default_target_folder,
+                         download_pool, remove_download_dir, save_download, session_download_dir, wait_until)
+
+# The summary page the browser sessions open, without the credentials (they go in a basic auth header)
+SUMMARY_URL = "https://gopricing.ssnc-corp.cloud/clients/reports/otcReportSummary.go?action=handleSummaryFilter"
+
+# Form fields and buttons, by name or id, as on the portal pages
+VALUATION_DATE_FIELD = 'valuationDate'
+CLIENT_SEARCH_FIELD = 'clientSearch'
+EXPORT_BUTTON_NAME = 'handleExcelDownLoad'
+
+# Reports are written to disk in chunks of this size as they arrive, never held in memory whole
+CHUNK_SIZE = 1024 * 1024
+
+ALERT_PATTERN = re.compile(r"""alert\(\s*['"](.*?)['"]\s*\)""")
+
+# Tags without an end tag
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+
+
+class Form:
+    """A form of a portal page: where it posts, its field values and its selects and submit buttons."""
+
+    def __init__(self, attrs):
+        self.id = attrs.get('id')
+        self.action = attrs.get('action') or ''
+        self.method = (attrs.get('method') or 'get').lower()
+        self.fields = {}  # Values sent as they are: text, hidden, checked boxes, selected options
+        self.selects = {}  # Select name -> option values, in page order
+        self.submits = {}  # Submit button name -> value, only the one clicked is sent
+
+
+class PageParser(HTMLParser):
+    """
+    Collects the forms of a page, the link in #notificationMsg and the notifications under #mainContent.
+    Each notification is a table of its own, newest first, with one row of cells per table row
+    (the same tables the browser sessions read by XPath).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.forms = []
+        self.notification_link = None
+        self.notifications = []  # Per notification, a [cell texts, link hrefs] pair per table row
+        self._form = None
+        self._select = None
+        self._option = None
+        self._in_notification_msg = False
+        self._main_depth = 0  # Open tags inside #mainContent, 0 when outside it
+        self._table = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or '' for name, value in attrs}
+        if self._main_depth and tag not in VOID_TAGS:
+            self._main_depth += 1
+        elif attrs.get('id') == 'mainContent':
+            self._main_depth = 1
+        if attrs.get('id') == 'notificationMsg':
+            self._in_notification_msg = True
+
+        if tag == 'form':
+            self._form = Form(attrs)
+            self.forms.append(self._form)
+        elif tag == 'input' and self._form is not None and attrs.get('name'):
+            kind = attrs.get('type', 'text').lower()
+            if kind in ('submit', 'button', 'image'):
+                self._form.submits[attrs['name']] = attrs.get('value', '')
+            elif kind not in ('checkbox', 'radio') or 'checked' in attrs:
+                self._form.fields[attrs['name']] = attrs.get('value', '')
+        elif tag == 'select' and self._form is not None:
+            self._select = attrs.get('name')
+            self._form.selects[self._select] = []
+        elif tag == 'option' and self._select is not None:
+            self._option = attrs.get('value')
+            if self._option is not None:
+                self._add_option(self._option, 'selected' in attrs)
+        elif tag == 'a':
+            if self._in_notification_msg and self.notification_link is None:
+                self.notification_link = attrs.get('href')
+            if self._cell is not None and attrs.get('href'):
+                self._table[-1][1].append(attrs['href'])
+
+        if self._main_depth and tag == 'table':
+            self._table = []
+            self.notifications.append(self._table)
+        elif self._table is not None and tag == 'tr':
+            self._table.append([[], []])
+        elif self._table is not None and self._table and tag in ('td', 'th'):
+            self._cell = []
+            self._table[-1][0].append(self._cell)
+
+    def _add_option(self, value, selected):
+        options = self._form.selects[self._select]
+        options.append(value)
+        if selected or len(options) == 1:
+            self._form.fields[self._select] = value
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+        if self._select is not None and self._option is None and data.strip():
+            # An option without a value sends its text
+            self._option = data.strip()
+            self._add_option(self._option, False)
+
+    def handle_endtag(self, tag):
+        if self._main_depth and tag not in VOID_TAGS:
+            self._main_depth -= 1
+        if tag == 'form':
+            self._form = None
+        elif tag == 'select':
+            self._select = None
+        elif tag == 'option':
+            self._option = None
+        elif tag in ('td', 'th'):
+            self._cell = None
+        elif tag == 'table':
+            self._table = None
+        elif tag == 'div':
+            self._in_notification_msg = False
+
+
+def parse_page(html):
+    parser = PageParser()
+    parser.feed(html)
+    parser.close()
+    return parser
+
+
+def alert_text(html):
+    """Text of the JavaScript alert a portal page raises (e.g. "Error"), None if it has none."""
+    match = ALERT_PATTERN.search(html)
+    return match.group(1) if match else None
+
+
+def notification_rows(parser):
+    """(details, download link or None) of each notification, newest first: row 8 and row 9 of its table."""
+    rows = []
+    for table in parser.notifications:
+        if len(table) < 9:
+            continue
+        cells, _ = table[7]
+        details = ' '.join(''.join(cells[1]).split()) if len(cells) > 1 else ''
+        links = table[8][1]
+        rows.append((details, links[0] if links else None))
+    return rows
+
+
+def find_form(parser, field):
+    """The form with this field, select or submit button on the page."""
+    for form in parser.forms:
+        if field in form.fields or field in form.selects or field in form.submits:
+            return form
+    raise ValueError(f"No form with '{field}' on the portal page")
+
+
+class PortalHttpSession:
+    """
+    Does what gopx_portal.PortalSession does, over plain HTTP instead of a browser: it posts the
+    summary filter and the Excel export forms, polls the notifications and streams the report to
+    disk. No Chrome, so a date costs a few requests rather than a browser's memory and CPU.
+    Field names and values are read from the pages themselves; only the valuation date, the
+    client and the report are filled in. The client is sent as typed, as the search box does.
+    Each session has its own cookies (the portal keeps the filter per login) but sessions can
+    share one pooled `adapter`, so connections are reused across them (see download_dates_http).
+    """
+
+    def __init__(self, client, username, password, report_index=1, target_folder=None, log=print,
+                 gate=None, summary_url=SUMMARY_URL, adapter=None):
+        self.client = client
+        self.summary_url = summary_url
+        self.target_folder = target_folder or default_target_folder(client)
+        self.report_index = report_index  # Option of the report select to export, 0 keeps the default
+        self.log = log
+        self.gate = gate
+        self.download_dir = None
+        self.notifications_url = None
+        self.http = requests.Session()
+        self.http.auth = (username, password)
+        adapter = adapter or HTTPAdapter()
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+    def cleanup(self):
+        self.http.close()
+        if self.download_dir is not None:
+            remove_download_dir(self.download_dir)
+            self.download_dir = None
+
+    def _page(self, response, target_date_str):
+        response.raise_for_status()
+        text = alert_text(response.text)
+        if text is not None:
+            raise PortalAlert(f"Portal alert for {target_date_str}: {text}")
+        return parse_page(response.text)
+
+    def _send(self, form, fields, page_url, target_date_str):
+        url = urljoin(page_url, form.action) if form.action else page_url
+        if form.method == 'post':
+            response = self.http.post(url, data=fields, timeout=PAGE_TIMEOUT)
+        else:
+            response = self.http.get(url, params=fields, timeout=PAGE_TIMEOUT)
+        return response.url, self._page(response, target_date_str)
+
+    def submit(self, target_date_str):
+        """Request the export for one valuation date (DD-Mon-YYYY) without waiting for the report."""
+        response = self.http.get(self.summary_url, timeout=PAGE_TIMEOUT)
+        page = self._page(response, target_date_str)
+
+        # Filter the summary on the valuation date and client
+        form = find_form(page, VALUATION_DATE_FIELD)
+        fields = dict(form.fields, **{VALUATION_DATE_FIELD: target_date_str, CLIENT_SEARCH_FIELD: self.client})
+        fields.update(list(form.submits.items())[:1])
+        url, page = self._send(form, fields, response.url, target_date_str)
+
+        # Pick the report and request the export
+        form = find_form(page, EXPORT_BUTTON_NAME)
+        fields = dict(form.fields)
+        if self.report_index and form.selects:
+            name, options = next(iter(form.selects.items()))
+            fields[name] = options[min(self.report_index, len(options) - 1)]
+        fields[EXPORT_BUTTON_NAME] = form.submits[EXPORT_BUTTON_NAME]
+        if self.gate is not None:
+            self.gate.wait()
+        url, page = self._send(form, fields, url, target_date_str)
+        if page.notification_link:
+            self.notifications_url = urljoin(url, page.notification_link)
+        if self.notifications_url is None:
+            raise ValueError(f"The portal did not link to the notifications after the {target_date_str} export")
+
+    def report_links(self, target_date_str):
+        """Download links of the finished reports for this valuation date, newest first."""
+        response = self.http.get(self.notifications_url, timeout=PAGE_TIMEOUT)
+        page = self._page(response, target_date_str)
+        return [urljoin(response.url, link) for details, link in notification_rows(page)
+                if link and target_date_str in details]
+
+    def download(self, target_date_str):
+        """
+        Export and save the report for one valuation date. A portal alert is raised as PortalAlert,
+        HTTP errors as requests exceptions.
+        """
+        # Reports of the date already listed are from earlier runs
+        known = set(self.report_links(target_date_str)) if self.notifications_url else None
+        self.submit(target_date_str)
+        if known is None:
+            known = set(self.report_links(target_date_str))
+
+        def new_report():
+            links = [link for link in self.report_links(target_date_str) if link not in known]
+            return links[0] if links else None
+
+        link = wait_until(new_report, REPORT_TIMEOUT, f"the {target_date_str} report", first_interval=2, max_interval=30)
+        return self.fetch(link, target_date_str)
+
+    def fetch(self, link, target_date_str):
+        """Stream a report to this session's folder and move it into the target folder once complete."""
+        if self.download_dir is None:
+            self.download_dir = session_download_dir(self.target_folder)
+        partial = os.path.join(self.download_dir, 'report.xlsx.part')
+        with self.http.get(link, stream=True, timeout=PAGE_TIMEOUT) as response:
+            response.raise_for_status()
+            with open(partial, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+        return save_download(partial, self.target_folder, self.client, target_date_str)
+
+
+def download_dates_http(client, username, password, dates, workers=DEFAULT_WORKERS, report_index=1,
+                        target_folder=None, log=print, on_result=None, controller=None, summary_url=SUMMARY_URL):
+    """
+    gopx_portal.download_dates with HTTP sessions instead of browsers: the same pool, rate
+    control, circuit breaker and retries (see portal_jobs.download_pool). The sessions share one
+    connection pool.
+    """
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+
+    def open_session(session_log, gate):
+        return PortalHttpSession(client, username, password, report_index, target_folder, log=session_log,
+                                 gate=gate, summary_url=summary_url, adapter=adapter)
+
+    try:
+        return download_pool(dates, open_session, workers, log=log, on_result=on_result, controller=controller)
+    finally:
+        adapter.close()
@@ -0,0 +1,276 @@
+import argparse
+import io
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from html import escape
+
+from flask import Flask, Response, request
+from openpyxl import Workbook
+from werkzeug.serving import make_server
+
+# Path of the summary page, as on the real portal
+SUMMARY_PATH = '/clients/reports/otcReportSummary.go'
+
+# Reports the export form offers, in the order of the portal's dropdown
+REPORTS = ['OTC Summary', 'ALL OTC', 'IRS']
+
+DEFAULT_PORT = 8765
+STUB_USERNAME = 'stub'
+STUB_PASSWORD = 'stub'
+
+# Downloads are sent in chunks of this size
+CHUNK_SIZE = 64 * 1024
+
+PAGE = '''<html><head><title>GoPricing</title>{script}</head><body>
+{notification}
+{body}
+</body></html>'''
+
+SUMMARY_FORM = '''<form id="runSummaryFlag" method="post" action="otcReportSummary.go?action=handleSummaryFilter">
+<table><tbody><tr><td><table><tbody>
+<tr><td><input type="submit" name="runSummary" value="Filter"></td></tr>
+<tr><td>Valuation Date <input type="text" id="valuationDate" name="valuationDate" value="{date}"></td></tr>
+<tr><td>Client <input type="text" id="clientSearch" name="clientSearch" value="{client}"></td></tr>
+</tbody></table></td></tr></tbody></table>
+</form>'''
+
+EXPORT_FORM = '''<form id="excelDownloadTag" method="post" action="otcReportSummary.go?action=handleExcelDownLoad">
+<input type="hidden" name="valuationDate" value="{date}">
+<input type="hidden" name="clientSearch" value="{client}">
+<table><tbody><tr><td><table><tbody>
+<tr><td>Summary for {client} on {date}</td></tr>
+<tr><td><select name="reportName">{options}</select></td>
+<td><input type="submit" name="handleExcelDownLoad" value="Export to Excel"></td></tr>
+</tbody></table></td></tr></tbody></table>
+</form>'''
+
+NOTIFICATION = '''<div><div><table><tbody>
+<tr><td>Report</td><td>{report}</td></tr>
+<tr><td>Client</td><td>{client}</td></tr>
+<tr><td>Requested By</td><td>{username}</td></tr>
+<tr><td>Status</td><td>{status}</td></tr>
+<tr><td>Format</td><td>Excel</td></tr>
+<tr><td>Request Time</td><td>{requested}</td></tr>
+<tr><td>Start Time</td><td>{requested}</td></tr>
+<tr><td>End Time</td><td>{end}</td></tr>
+<tr><td>Download</td><td>{link}</td></tr>
+</tbody></table></div></div>'''
+
+
+class StubPortal:
+    """
+    Stand-in for the GoPricing report summary, for trying the downloaders offline: the summary
+    filter and Excel export forms, the notifications list and report downloads, behind basic auth.
+    It misbehaves like the portal: a report takes `render_seconds` (give or take `jitter`) to
+    build, and an export gets the "Error" alert page when it comes less than `min_gap` seconds
+    after the previous one, while `max_building` reports are already being built, or at random
+    (`error_rate`). `report_file` is served for every report instead of a generated workbook.
+    """
+
+    def __init__(self, render_seconds=5, jitter=0.5, min_gap=1.0, max_building=4, error_rate=0.0,
+                 report_file=None, username=STUB_USERNAME, password=STUB_PASSWORD):
+        self.render_seconds = render_seconds
+        self.jitter = jitter
+        self.min_gap = min_gap
+        self.max_building = max_building
+        self.error_rate = error_rate
+        self.report_file = report_file
+        self.username = username
+        self.password = password
+        self.jobs = []  # Export requests, oldest first
+        self.errors = 0
+        self._ids = itertools.count(1)
+        self._last_export = None
+        self._lock = threading.Lock()
+
+    def app(self):
+        app = Flask(__name__)
+        app.add_url_rule(SUMMARY_PATH, 'summary', self.summary, methods=['GET', 'POST'])
+        return app
+
+    def summary(self):
+        auth = request.authorization
+        if auth is None or (auth.username, auth.password) != (self.username, self.password):
+            return Response('Login required', 401, {'WWW-Authenticate': 'Basic realm="GoPricing"'})
+
+        action = request.args.get('action', 'handleSummaryFilter')
+        date = request.values.get('valuationDate', '')
+        client = request.values.get('clientSearch', '')
+        if action == 'handleSummaryFilter':
+            body = SUMMARY_FORM.format(date=escape(date), client=escape(client))
+            if request.method == 'POST':
+                options = ''.join(f'<option value="{escape(name)}">{escape(name)}</option>' for name in REPORTS)
+                body += EXPORT_FORM.format(date=escape(date), client=escape(client), options=options)
+            return self.page(body)
+        if action == 'handleExcelDownLoad':
+            return self.export(date, client, request.values.get('reportName', REPORTS[0]))
+        if action == 'notifications':
+            return self.page(self.notifications())
+        if action == 'download':
+            return self.download(request.args.get('id', ''))
+        return Response('Unknown action', 404)
+
+    def page(self, body, script=''):
+        notification = ''
+        if self.jobs:
+            notification = '<div id="notificationMsg"><a href="otcReportSummary.go?action=notifications">Notifications</a></div>'
+        return PAGE.format(script=script, notification=notification, body=body)
+
+    def export(self, date, client, report):
+        now = time.monotonic()
+        with self._lock:
+            building = sum(1 for job in self.jobs if job['ready'] > now)
+            refused = (not date or not client
+                       or (self._last_export is not None and now - self._last_export < self.min_gap)
+                       or building >= self.max_building
+                       or random.random() < self.error_rate)
+            self._last_export = now
+            if refused:
+                self.errors += 1
+                return self.page('', script="<script>alert('Error');</script>")
+            render = max(0.0, self.render_seconds + random.uniform(-self.jitter, self.jitter))
+            self.jobs.append({'id': next(self._ids), 'date': date, 'client': client, 'report': report,
+                              'requested': datetime.now(), 'ready': now + render, 'render': render})
+        return self.page(f'<p>Your {escape(report)} report for {escape(date)} has been requested.</p>')
+
+    def notifications(self):
+        now = time.monotonic()
+        with self._lock:
+            jobs = list(reversed(self.jobs))
+        tables = []
+        for job in jobs:
+            ready = job['ready'] <= now
+            end = job['requested'] + timedelta(seconds=job['render'])
+            tables.append(NOTIFICATION.format(
+                report=escape(job['report']), client=escape(job['client']), username=escape(self.username),
+                status='Completed' if ready else 'In Progress', requested=f"{job['requested']:%d-%b-%Y %H:%M:%S}",
+                end=f"{end:%H:%M:%S} ({escape(job['date'])})" if ready else '',
+                link=f'<a href="otcReportSummary.go?action=download&amp;id={job["id"]}"><img src="excel.gif"></a>' if ready else '',
+            ))
+        return '<div id="mainContent">' + ''.join(tables) + '</div>'
+
+    def download(self, job_id):
+        now = time.monotonic()
+        with self._lock:
+            job = next((job for job in self.jobs if str(job['id']) == job_id and job['ready'] <= now), None)
+        if job is None:
+            return Response('No such report', 404)
+        data = self.report_bytes(job)
+
+        def chunks():
+            for start in range(0, len(data), CHUNK_SIZE):
+                yield data[start:start + CHUNK_SIZE]
+
+        filename = f"{job['client']}_{job['date']}.xlsx"
+        return Response(chunks(), mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                                 'Content-Length': str(len(data))})
+
+    def report_bytes(self, job):
+        if self.report_file:
+            with open(self.report_file, 'rb') as f:
+                return f.read()
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = 'IRS'
+        sheet.append(['Client', job['client']])
+        sheet.append(['Valuation Date', job['date']])
+        sheet.append(['Report', job['report']])
+        output = io.BytesIO()
+        workbook.save(output)
+        return output.getvalue()
+
+
+class StubServer:
+    """Runs a StubPortal on localhost in a background thread, e.g. for a benchmark. Use as a context manager."""
+
+    def __init__(self, portal, port=0):
+        self.portal = portal
+        self.server = make_server('127.0.0.1', port, portal.app(), threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def summary_url(self):
+        return f'http://127.0.0.1:{self.port}{SUMMARY_PATH}?action=handleSummaryFilter'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+
+
+def benchmark(portal, days, workers, stagger, client='ASGARD'):
+    """
+    Download `days` business days from a local stub with the HTTP client and report the throughput.
+    Submissions start `stagger` seconds apart and adapt from there, as in a real run.
+    """
+    # Only the benchmark needs the client (and requests), the stub itself does not
+    from gopx_http import download_dates_http
+    from portal_jobs import (BREAKER_COOLDOWN, BREAKER_FAILURES, BREAKER_MAX_TRIPS, BREAKER_WINDOW,
+                             MAX_SUBMIT_DELAY)
+    from rate_control import RateController
+
+    dates = []
+    day = datetime(2025, 3, 3)
+    while len(dates) < days:
+        if day.weekday() < 5:
+            dates.append(day.strftime('%d-%b-%Y'))
+        day += timedelta(days=1)
+
+    target = tempfile.mkdtemp(prefix='gopx-stub-')
+    with StubServer(portal) as server:
+        controller = RateController(workers, stagger, stagger / 4, MAX_SUBMIT_DELAY, delay_step=stagger / 4,
+                                    window=BREAKER_WINDOW, max_failures=BREAKER_FAILURES,
+                                    cooldown=BREAKER_COOLDOWN, max_trips=BREAKER_MAX_TRIPS)
+        started = time.monotonic()
+        results = download_dates_http(client, portal.username, portal.password, dates, workers=workers,
+                                      target_folder=target, controller=controller, summary_url=server.summary_url)
+        elapsed = time.monotonic() - started
+
+    downloaded = [path for path in results.values() if isinstance(path, str)]
+    print(f"Downloaded {len(downloaded)} of {len(dates)} reports in {elapsed:.1f}s "
+          f"({len(downloaded) / elapsed * 60:.1f} per minute), {portal.errors} export(s) refused")
+    print(f"Reports saved in {target}")
+    missing = [date for date, path in results.items() if not isinstance(path, str)]
+    for date in missing:
+        print(f"  {date}: {results[date]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the GoPricing report portal.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--render', type=float, default=5, help="Seconds a report takes to build")
+    parser.add_argument('--min-gap', type=float, default=1.0, help="Exports closer together than this get the Error alert")
+    parser.add_argument('--max-building', type=int, default=4, help="Reports built at once before exports get the Error alert")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of exports refused at random")
+    parser.add_argument('--report', default=None, help="Workbook served for every report instead of a generated one")
+    parser.add_argument('--bench', type=int, default=None, metavar='DAYS',
+                        help="Instead of serving, download this many business days with the HTTP client and time it")
+    parser.add_argument('--workers', type=int, default=3, help="Most sessions used by --bench")
+    parser.add_argument('--stagger', type=float, default=2.0, help="Seconds between the first submissions of --bench")
+    args = parser.parse_args()
+
+    if args.report and not os.path.isfile(args.report):
+        parser.error(f"No such file: {args.report}")
+    portal = StubPortal(render_seconds=args.render, min_gap=args.min_gap, max_building=args.max_building,
+                        error_rate=args.error_rate, report_file=args.report)
+    if args.bench:
+        benchmark(portal, args.bench, args.workers, args.stagger)
+        return
+
+    print(f"Stub portal on http://127.0.0.1:{args.port}{SUMMARY_PATH}?action=handleSummaryFilter "
+          f"(user {portal.username}, password {portal.password})")
+    portal.app().run(host='127.0.0.1', port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
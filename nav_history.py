@@ -0,0 +1,185 @@
+import argparse
+import os
+import shutil
+
+import pandas as pd
+
+# Default location, can be overridden through the environment
+DEFAULT_HISTORY_DIR = os.environ.get(
+    'NAV_HISTORY_DIR', os.path.join(os.path.expanduser('~'), '.nav_history')
+)
+
+# Datasets kept in the store: the derivatives CSV processors and the IRS workbook processor
+# have different columns, so they are stored side by side
+DERIVATIVES_DATASET = 'derivatives'
+IRS_DATASET = 'irs'
+
+# Partitions are written as parquet. Pickle partitions written by earlier versions are still read.
+PARTITION_EXTENSIONS = ('.parquet', '.pkl')
+PARTITION_FILE = 'part'
+
+
+def mixed_columns(df):
+    """Object columns that mix text and numbers, e.g. 'Rec Rate' and 'Pay Rate' (a rate or an index name per leg)."""
+    return [col for col in df.columns
+            if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed')]
+
+
+def parquet_ready(day):
+    """
+    Copy of day with the mixed text and number columns (see mixed_columns) stored as text, since
+    parquet needs one type per column. Missing values stay missing.
+    """
+    mixed = mixed_columns(day)
+    if not mixed:
+        return day
+    day = day.copy()
+    for col in mixed:
+        day[col] = day[col].where(day[col].isna(), day[col].astype(str))
+    return day
+
+
+class HistoryStore:
+    """
+    Local store of processed trades, partitioned by dataset, client and valuation date:
+        <store_dir>/<dataset>/client=<CLIENT>/date=<YYYY-MM-DD>/part.parquet
+    Appending a day writes (or replaces) that day's partition only. Reads skip every partition
+    outside the requested date range without opening it, and load only the requested columns.
+    The directory names follow the hive convention, so SQL engines see client and date as columns (see nav_sql.py).
+    """
+
+    def __init__(self, store_dir=None, dataset=DERIVATIVES_DATASET):
+        self.store_dir = store_dir or DEFAULT_HISTORY_DIR
+        self.dataset = dataset
+
+    def _client_dir(self, client):
+        return os.path.join(self.store_dir, self.dataset, f'client={client.strip().upper()}')
+
+    def clients(self):
+        dataset_dir = os.path.join(self.store_dir, self.dataset)
+        if not os.path.isdir(dataset_dir):
+            return []
+        return sorted(name[len('client='):] for name in os.listdir(dataset_dir) if name.startswith('client='))
+
+    def partitions(self, client, start=None, end=None):
+        """Return [(date, path)] for the client's stored days, oldest first, limited to start..end (inclusive)."""
+        client_dir = self._client_dir(client)
+        if not os.path.isdir(client_dir):
+            return []
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        partitions = []
+        for name in os.listdir(client_dir):
+            if not name.startswith('date='):
+                continue
+            date = pd.Timestamp(name[len('date='):])
+            if (start is not None and date < start) or (end is not None and date > end):
+                continue
+            for ext in PARTITION_EXTENSIONS:
+                path = os.path.join(client_dir, name, PARTITION_FILE + ext)
+                if os.path.exists(path):
+                    partitions.append((date, path))
+                    break
+        return sorted(partitions)
+
+    def dates(self, client):
+        return [date for date, _ in self.partitions(client)]
+
+    def append(self, df, client, date_column):
+        """
+        Store each valuation date in df as its own partition, replacing any partition already
+        stored for that client and date. Returns the dates written.
+        """
+        client_dir = self._client_dir(client)
+        os.makedirs(client_dir, exist_ok=True)
+        dates = pd.to_datetime(df[date_column])
+
+        written = []
+        for date, rows in df.groupby(dates, observed=True).indices.items():
+            self._write_partition(client_dir, pd.Timestamp(date), df.iloc[rows].reset_index(drop=True))
+            written.append(pd.Timestamp(date))
+        return sorted(written)
+
+    def _write_partition(self, client_dir, date, day):
+        date_dir = os.path.join(client_dir, f'date={date:%Y-%m-%d}')
+        os.makedirs(date_dir, exist_ok=True)
+        stem = os.path.join(date_dir, PARTITION_FILE)
+        # Write to a temp file and rename so a reader never sees a partial partition
+        tmp_path = f'{stem}.{os.getpid()}.tmp'
+        try:
+            parquet_ready(day).to_parquet(tmp_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, stem + '.parquet')
+        # A pickle copy of the day from an earlier version is now stale
+        if os.path.exists(stem + '.pkl'):
+            os.remove(stem + '.pkl')
+
+    def read(self, client, start=None, end=None, columns=None):
+        """
+        Load the client's history between start and end (inclusive) as one DataFrame.
+        Only the partitions in range are opened and, for parquet partitions, only `columns` are read.
+        Returns None when nothing is stored in the range.
+        """
+        frames = []
+        for _, path in self.partitions(client, start, end):
+            if path.endswith('.parquet'):
+                frames.append(pd.read_parquet(path, columns=columns))
+            else:
+                day = pd.read_pickle(path)
+                frames.append(day if columns is None else day[[col for col in columns if col in day.columns]])
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+    def drop(self, client, start=None, end=None):
+        """Delete the client's partitions between start and end. Returns the number removed."""
+        partitions = self.partitions(client, start, end)
+        for _, path in partitions:
+            shutil.rmtree(os.path.dirname(path))
+        client_dir = self._client_dir(client)
+        if os.path.isdir(client_dir) and not os.listdir(client_dir):
+            shutil.rmtree(client_dir)
+        return len(partitions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, export or prune the processed NAV report history.")
+    parser.add_argument('--dir', default=None, help=f"History directory (default: {DEFAULT_HISTORY_DIR})")
+    parser.add_argument('--dataset', default=DERIVATIVES_DATASET, choices=[DERIVATIVES_DATASET, IRS_DATASET])
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('info', help="List the clients and the valuation dates stored for each")
+    for name, help_text in [('export', "Write a client's history to a CSV file"), ('drop', "Delete stored days")]:
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('client')
+        command.add_argument('--start', default=None, help="First valuation date, e.g. 2025-03-01")
+        command.add_argument('--end', default=None, help="Last valuation date, e.g. 2025-03-31")
+        if name == 'export':
+            command.add_argument('--columns', default=None, help="Comma-separated columns to export")
+            command.add_argument('--output', required=True, help="CSV file to write")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.dir, args.dataset)
+
+    if args.command == 'info':
+        print(f"History directory: {os.path.join(store.store_dir, store.dataset)}")
+        for client in store.clients():
+            dates = store.dates(client)
+            span = f"{dates[0]:%Y-%m-%d} to {dates[-1]:%Y-%m-%d}" if dates else "empty"
+            print(f"  {client}: {len(dates)} days, {span}")
+    elif args.command == 'export':
+        columns = args.columns.split(',') if args.columns else None
+        history = store.read(args.client, args.start, args.end, columns)
+        if history is None:
+            print("Nothing stored for that client and date range.")
+            return
+        history.to_csv(args.output, index=False)
+        print(f"Exported {len(history)} rows to {args.output}")
+    elif args.command == 'drop':
+        print(f"Removed {store.drop(args.client, args.start, args.end)} days")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from pandas.io.parsers import TextParser
+
+from report_layout import IRS_FIELDS, SNIFF_ROWS, get_layout, sniff_csv_layout
+from trade_schema import normalise_dates
+
+# Bump whenever the normalised output of a reader changes, so old cache entries are ignored
+CSV_PARSER_VERSION = 5
+XLSX_PARSER_VERSION = 4
+
+# Rows per chunk when streaming a report, keeps peak memory bounded on very large files
+CSV_CHUNKSIZE = 100_000
+
+
+def parse_numbers(values):
+    """
+    Floats from a column the parser could not type by itself, e.g. '1,234.50' next to 'n/a'.
+    TRUE/FALSE cells (e.g. in the BBG curve MV) become 1 and 0.
+    Returns (floats, number of non-blank cells that are not numbers, which become NaN).
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float), 0
+    text = values.astype(str).str.strip().str.replace(',', '', regex=False)
+    text = text.where(values.notna() & (text != ''))
+    upper = text.str.upper()
+    text = text.mask(upper == 'TRUE', '1').mask(upper == 'FALSE', '0')
+    floats = pd.to_numeric(text, errors='coerce')
+    return floats, int((text.notna() & floats.isna()).sum())
+
+
+def unparseable_counts(frames):
+    """Total unparseable numeric cells per column over the frames returned by the readers."""
+    counts = {}
+    for frame in frames:
+        for col, count in frame.attrs.get('unparseable', {}).items():
+            counts[col] = counts.get(col, 0) + count
+    return counts
+
+
+def extract_date_from_filename(filename):
+    """Extract the YYYYMMDD date from a name like ASGARD_OTCDerivativesReport-20250129.csv"""
+    return os.path.basename(filename).split('-')[-1].split('.')[0]
+
+
+def report_sort_key(filename):
+    """Sort key that orders report files by the date in their filename."""
+    return extract_date_from_filename(filename), os.path.basename(filename)
+
+
+def read_report_csv(file_to_read, name=None, chunksize=CSV_CHUNKSIZE):
+    """
+    Reads one daily derivatives CSV and normalises it.
+    The header is found by sniffing the top of the file (see report_layout.py), then only the
+    fields the processors use are parsed, streamed in chunks of `chunksize` rows, and returned
+    in DERIVATIVES_FIELDS order. Drops the totals row and tags the Report Date.
+    The numeric fields come out as floats and the trade dates as datetimes; how many of their cells were not numbers is
+    kept per column in data.attrs['unparseable'].
+    `name` is used for the Report Date when reading an uploaded file object.
+    """
+    layout = sniff_csv_layout(file_to_read)
+    positions = dict(zip(layout.names, layout.positions))
+
+    chunks = []
+    unparseable = dict.fromkeys(layout.numeric, 0)
+    # The parser reads '1,234.50' as a number itself; only a chunk with a stray text cell needs parse_numbers
+    with pd.read_csv(file_to_read, header=None, skiprows=layout.header_row + 1, usecols=layout.positions,
+                     thousands=',', chunksize=chunksize) as reader:
+        for chunk in reader:
+            # usecols keeps file order, this puts the columns back in field order
+            chunk = chunk[layout.positions]
+            # Remove rows where Trade ID 1 is missing (i.e., remove totals row)
+            chunk = chunk[chunk.iloc[:, 0].notna()].copy()
+            for col in layout.numeric:
+                chunk[positions[col]], count = parse_numbers(chunk[positions[col]])
+                unparseable[col] += count
+            chunks.append(chunk)
+
+    data = pd.concat(chunks, ignore_index=True)
+    data.columns = layout.names
+    data.attrs['unparseable'] = unparseable
+
+    # Trade, effective, maturity and load dates come out as datetime64
+    normalise_dates(data)
+
+    # Add Report Date column based on filename
+    data['Report Date'] = extract_date_from_filename(name or file_to_read)
+
+    return data
+
+
+def load_report_csv(file_to_read, name=None, cache=None):
+    """Same as read_report_csv, but served from the parse cache when the file has been seen before."""
+    if cache is None:
+        return read_report_csv(file_to_read, name)
+
+    # The Report Date comes from the name, so it is part of the key as well as the content
+    name = name or file_to_read
+    return cache.get_or_parse(
+        file_to_read,
+        lambda content: read_report_csv(content, name),
+        kind='csv',
+        version=CSV_PARSER_VERSION,
+        extra=extract_date_from_filename(name)
+    )
+
+
+def read_reports(files, workers=1, cache=None):
+    """
+    Reads and normalises every report in `files`.
+    With workers > 1 the files are parsed in a process pool. Results always
+    come back in filename date order so the combined frame is deterministic.
+    """
+    files = sorted(files, key=report_sort_key)
+    workers = min(workers or 1, len(files))
+    read = partial(load_report_csv, cache=cache)
+
+    if workers <= 1:
+        results = [read(f) for f in files]
+    else:
+        # map() keeps input order, so the merge order does not depend on which worker finishes first
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(read, files))
+
+    if cache is not None:
+        cache.evict()
+    return results
+
+
+def load_reports(files, workers=1, cache=None):
+    """Reads all reports and combines them, dropping the totals rows (no Trade ID 1)."""
+    frames = read_reports(files, workers, cache)
+    data = pd.concat(frames, ignore_index=True).dropna(subset=['Trade ID 1'])
+    data.attrs['unparseable'] = unparseable_counts(frames)
+    return data
+
+
+def parse_valuation_date(row_11_text):
+    """
+    Extracts the Valuation Date from the row 11 text of the 'IRS' sheet.
+    Converts the extracted date to DDMMYYYY format, or returns None if there is no date.
+    """
+    if not isinstance(row_11_text, str):
+        return None
+
+    # Look for "Valuation Date [DD-MMM-YYYY]"
+    match = re.search(r'Valuation Date \[(\d{2})-(\w{3})-(\d{4})\]', row_11_text)
+    if not match:
+        return None
+
+    day, month_str, year = match.groups()
+
+    # Convert month abbreviation to number
+    month_map = {
+        "Jan": "01", "Feb": "02", "Mar": "03", "Apr": "04", "May": "05", "Jun": "06",
+        "Jul": "07", "Aug": "08", "Sep": "09", "Oct": "10", "Nov": "11", "Dec": "12"
+    }
+    month = month_map.get(month_str, "00")
+
+    return f"{day}{month}{year}"  # Return date in DDMMYYYY format
+
+
+def _convert_cell(value):
+    """Convert a cell value the same way pandas' openpyxl reader does."""
+    if value is None:
+        return ""
+    if isinstance(value, str) and value in ERROR_CODES:
+        return np.nan
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value) if int(value) == value else float(value)
+    return value
+
+
+def read_irs_sheet_rows(file_to_read):
+    """
+    Streams the 'IRS' sheet once in read-only mode and returns its rows as lists,
+    trimmed and padded the same way pd.read_excel would see them.
+    """
+    wb = load_workbook(file_to_read, read_only=True, data_only=True, keep_links=False)
+    try:
+        if "IRS" not in wb.sheetnames:
+            raise ValueError("Worksheet named 'IRS' not found")
+
+        sheet = wb["IRS"]
+        sheet.reset_dimensions()
+
+        rows = []
+        last_row_with_data = -1
+        for row_number, row in enumerate(sheet.iter_rows(values_only=True)):
+            converted_row = [_convert_cell(value) for value in row]
+            while converted_row and converted_row[-1] == "":
+                converted_row.pop()  # Trim trailing empty cells
+            if converted_row:
+                last_row_with_data = row_number
+            rows.append(converted_row)
+    finally:
+        wb.close()
+
+    # Trim trailing empty rows and pad every row to the same width
+    rows = rows[:last_row_with_data + 1]
+    width = max((len(row) for row in rows), default=0)
+    return [row + [""] * (width - len(row)) for row in rows]
+
+
+def read_irs_xlsx(file_to_read, name):
+    """
+    Reads the 'IRS' sheet of a NAV report workbook and normalises it.
+    The workbook is opened once: the Valuation Date, the header and the data block all come
+    from the same streamed pass over the sheet. The header is found wherever it sits in the
+    first rows (see report_layout.py) and only the IRS_FIELDS present in it are kept, under
+    their processor names, with the Report/Valuation Date columns added.
+    """
+    rows = read_irs_sheet_rows(file_to_read)
+    layout = get_layout(IRS_FIELDS, rows[:SNIFF_ROWS], required=False)
+
+    # Extract the Valuation Date from the preamble above the header (cell A11 in the usual layout)
+    valuation_date = None
+    for row in rows[:layout.header_row]:
+        valuation_date = parse_valuation_date(row[0] if row else None)
+        if valuation_date:
+            break
+
+    # Let pandas type the selected columns of the data block
+    data_rows = [[row[i] for i in layout.positions] for row in rows[layout.header_row + 1:]]
+    raw_data = TextParser(data_rows, header=None, names=layout.names, thousands=',', skip_blank_lines=False).read()
+
+    # Drop potential blank rows
+    raw_data = raw_data.iloc[1:].reset_index(drop=True)
+
+    # The numeric fields always come out as floats, text cells among them are counted
+    unparseable = {}
+    for col in layout.numeric:
+        raw_data[col], unparseable[col] = parse_numbers(raw_data[col])
+    normalise_dates(raw_data)
+
+    # Add a Report Date column
+    report_date = name.split('-')[-1].split('.')[0] if '-' in name else "Unknown Date"
+    raw_data["Report Date"] = report_date
+
+    # Add the Valuation Date column, as a datetime
+    raw_data["Valuation Date"] = pd.to_datetime(valuation_date, format='%d%m%Y') if valuation_date else pd.NaT
+
+    raw_data.attrs['unparseable'] = unparseable
+    return raw_data
+
+
+def load_irs_xlsx(file_to_read, name, cache=None):
+    """Same as read_irs_xlsx, but served from the parse cache when the workbook has been seen before."""
+    if cache is None:
+        return read_irs_xlsx(file_to_read, name)
+
+    return cache.get_or_parse(
+        file_to_read,
+        lambda content: read_irs_xlsx(content, name),
+        kind='xlsx',
+        version=XLSX_PARSER_VERSION,
+        extra=name
+    )
@@ -0,0 +1,96 @@
+import argparse
+import glob
+import os
+
+import duckdb
+
+from nav_history import DEFAULT_HISTORY_DIR, DERIVATIVES_DATASET, IRS_DATASET
+
+# Raised for bad SQL, unknown tables/columns etc., so callers need not import duckdb
+QueryError = duckdb.Error
+
+# Example for the CLI help and the Streamlit query box. Column names with spaces need double quotes.
+EXAMPLE_QUERY = '''SELECT "Currency", "Index_Maturity", count(*) AS breaches
+FROM irs
+WHERE client = 'ASGARD'
+  AND "Product Sub Type" = 'OIS'
+  AND "Currency" = 'SEK'
+  AND abs("Diff. in MV/IR DV01") > 8
+  AND date BETWEEN DATE '2025-01-01' AND DATE '2025-03-31'
+GROUP BY ALL
+ORDER BY breaches DESC'''
+
+
+def connect(store_dir=None, frames=None):
+    """
+    Open an in-memory DuckDB connection with a view per history dataset ('derivatives', 'irs').
+    The views scan the parquet partitions of the history store directly, with the client and
+    date partition keys as columns, so filters on them skip whole files and only the selected
+    columns are read.
+    `frames` ({name: DataFrame}) are registered as extra tables, e.g. the trades of the current session.
+    """
+    store_dir = store_dir or DEFAULT_HISTORY_DIR
+    con = duckdb.connect()
+    for dataset in (DERIVATIVES_DATASET, IRS_DATASET):
+        pattern = os.path.join(store_dir, dataset, 'client=*', 'date=*', '*.parquet')
+        if glob.glob(pattern):
+            # A view cannot take query parameters, so the path goes in as an escaped literal
+            path = pattern.replace("'", "''")
+            con.execute(
+                f"CREATE VIEW {dataset} AS "
+                f"SELECT * FROM read_parquet('{path}', hive_partitioning = true, union_by_name = true)"
+            )
+    for name, df in (frames or {}).items():
+        con.register(name, df)
+    return con
+
+
+def tables(con):
+    return [row[0] for row in con.execute("SELECT table_name FROM information_schema.tables ORDER BY 1").fetchall()]
+
+
+def query(sql, con=None, store_dir=None, frames=None):
+    """Run a SQL query against the history store (and any registered frames) and return a DataFrame."""
+    con = con or connect(store_dir, frames)
+    return con.execute(sql).df()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run SQL over the processed NAV report history.",
+        epilog=f"Example:\n  python nav_sql.py \"{' '.join(EXAMPLE_QUERY.split())}\"",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('sql', nargs='?', default=None, help="Query to run; starts an interactive prompt if omitted")
+    parser.add_argument('--dir', default=None, help=f"History directory (default: {DEFAULT_HISTORY_DIR})")
+    parser.add_argument('--output', default=None, help="Write the result to this CSV file instead of printing it")
+    args = parser.parse_args()
+
+    con = connect(args.dir)
+    print(f"Tables: {', '.join(tables(con)) or 'none (the history store is empty)'}")
+
+    if args.sql:
+        result = query(args.sql, con)
+        if args.output:
+            result.to_csv(args.output, index=False)
+            print(f"Wrote {len(result)} rows to {args.output}")
+        else:
+            print(result.to_string(index=False))
+        return
+
+    # Interactive prompt, one query per line, blank line or 'exit' to quit
+    while True:
+        try:
+            sql = input("sql> ").strip()
+        except EOFError:
+            break
+        if not sql or sql.lower() in ('exit', 'quit'):
+            break
+        try:
+            print(query(sql, con).to_string(index=False))
+        except QueryError as e:
+            print(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from nav_history import mixed_columns, parquet_ready
+
+# Default location and size cap, both can be overridden through the environment
+DEFAULT_CACHE_DIR = os.environ.get(
+    'NAV_PARSE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.nav_parse_cache')
+)
+DEFAULT_MAX_MB = float(os.environ.get('NAV_PARSE_CACHE_MAX_MB', 2048))
+
+# Memory budget for the in-process cache the Streamlit apps keep between reruns
+DEFAULT_MEMORY_MB = float(os.environ.get('NAV_MEMORY_CACHE_MAX_MB', 1024))
+
+# Upload digests remembered by the in-process cache, least recently used are forgotten first
+MAX_UPLOAD_DIGESTS = 1024
+
+# Entries are parquet. Pickle entries of earlier versions are never loaded, only evicted and purged.
+CACHE_EXTENSION = '.parquet'
+CACHE_EXTENSIONS = ('.parquet', '.pkl')
+
+# Parquet stores a column mixing text and numbers (e.g. 'Rec Rate' from the IRS workbooks) as text;
+# its numbers are kept next to it under this suffix and put back on load, so a hit equals a fresh parse
+NUMBERS_SUFFIX = ' [numbers]'
+
+
+def read_bytes(file):
+    """Return the raw bytes of a path or an uploaded/open file object."""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return f.read()
+    if hasattr(file, 'getvalue'):
+        return file.getvalue()
+    file.seek(0)
+    return file.read()
+
+
+def content_digest(file):
+    """sha256 hex digest of a path or an uploaded/open file object's content."""
+    return hashlib.sha256(read_bytes(file)).hexdigest()
+
+
+def _split_numbers(df):
+    """df plus, for each mixed text and number column, a NUMBERS_SUFFIX column with its numbers."""
+    mixed = mixed_columns(df)
+    if not mixed:
+        return df
+    df = df.copy()
+    for col in mixed:
+        is_number = df[col].map(lambda value: isinstance(value, (int, float, np.number)) and not isinstance(value, bool))
+        df[col + NUMBERS_SUFFIX] = pd.to_numeric(df[col].where(is_number), errors='coerce').astype(float)
+    return df
+
+
+def _join_numbers(df):
+    """Undo _split_numbers on a loaded entry."""
+    for col in [col for col in df.columns if col.endswith(NUMBERS_SUFFIX)]:
+        numbers = df.pop(col)
+        target = col[:-len(NUMBERS_SUFFIX)]
+        values = df[target].astype(object)
+        values[numbers.notna()] = numbers[numbers.notna()]
+        df[target] = values
+    return df
+
+
+class ParseCache:
+    """
+    On-disk cache of normalised per-file DataFrames.
+    Entries are keyed by a hash of the file content plus the parser kind/version,
+    so a changed file or a new parser version is simply a cache miss.
+    Least recently used entries are evicted once the cache exceeds max_mb.
+    """
+
+    def __init__(self, cache_dir=None, max_mb=None):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = int((DEFAULT_MAX_MB if max_mb is None else max_mb) * 1024 * 1024)
+
+    def key(self, content, kind, version, extra=''):
+        digest = hashlib.sha256(content)
+        digest.update(f'|{kind}|{version}|{extra}'.encode())
+        return f'{kind}-v{version}-{digest.hexdigest()}'
+
+    def _path(self, key, ext=CACHE_EXTENSION):
+        return os.path.join(self.cache_dir, key + ext)
+
+    def get(self, key):
+        """Load a cached frame, or None on a miss. A hit refreshes the entry's LRU timestamp."""
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+        os.utime(path)
+        return _join_numbers(df)
+
+    def put(self, key, df):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temp file and rename so a crash or a parallel worker never sees a partial entry
+        tmp_path = self._path(key, f'.{os.getpid()}.tmp')
+        try:
+            parquet_ready(_split_numbers(df)).to_parquet(tmp_path)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        os.replace(tmp_path, self._path(key))
+
+    def get_or_parse(self, file, parse, kind, version, extra=''):
+        """
+        Return the cached frame for `file`, or parse it and store the result.
+        `parse` receives an in-memory copy of the file, so the content is only read once.
+        """
+        content = read_bytes(file)
+        key = self.key(content, kind, version, extra)
+        df = self.get(key)
+        if df is None:
+            df = parse(io.BytesIO(content))
+            self.put(key, df)
+        return df
+
+    def entries(self):
+        """List (path, size, last_used) for every entry, least recently used first."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_EXTENSIONS):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes. Returns the number removed."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    def purge(self, older_than_days=None):
+        """Remove every entry, or only those not used in the last `older_than_days` days."""
+        cutoff = None
+        if older_than_days is not None:
+            cutoff = datetime.now().timestamp() - older_than_days * 86400
+        removed = 0
+        for path, _, last_used in self.entries():
+            if cutoff is None or last_used < cutoff:
+                self._remove(path)
+                removed += 1
+        return removed
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # Already evicted by another process
+
+
+class MemoryCache:
+    """
+    In-process LRU cache of DataFrames with a memory budget.
+    The Streamlit apps keep one of these alive across reruns, keyed by the content hashes
+    of the uploaded files, so widget changes skip reading and normalising the reports.
+    Frames are copied on the way out, callers are free to add or overwrite columns.
+    """
+
+    def __init__(self, max_mb=None):
+        self.max_bytes = int((DEFAULT_MEMORY_MB if max_mb is None else max_mb) * 1024 * 1024)
+        self._entries = OrderedDict()  # key -> (frame, size in bytes), least recently used first
+        self._digests = OrderedDict()  # upload file_id -> content digest, least recently used first
+        self._lock = threading.Lock()  # Shared by every browser session of the app
+
+    def key(self, digests, kind, version, extra=''):
+        digest = hashlib.sha256('|'.join(digests).encode())
+        digest.update(f'|{kind}|{version}|{extra}'.encode())
+        return f'{kind}-v{version}-{digest.hexdigest()}'
+
+    def upload_digest(self, uploaded_file):
+        """
+        Content digest of an upload. Streamlit gives every upload a file_id, so each one is hashed
+        only once; the last MAX_UPLOAD_DIGESTS are remembered.
+        """
+        file_id = getattr(uploaded_file, 'file_id', None)
+        if file_id is None:
+            return content_digest(uploaded_file)
+        with self._lock:
+            digest = self._digests.get(file_id)
+            if digest is not None:
+                self._digests.move_to_end(file_id)
+                return digest
+        digest = content_digest(uploaded_file)
+        with self._lock:
+            self._digests[file_id] = digest
+            while len(self._digests) > MAX_UPLOAD_DIGESTS:
+                self._digests.popitem(last=False)
+        return digest
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            df = self._entries[key][0]
+        return df.copy()
+
+    def put(self, key, df):
+        """Store a copy of `df`, then evict least recently used frames until the cache fits its budget."""
+        df = df.copy()
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            self._entries[key] = (df, size)
+            self._entries.move_to_end(key)
+        self.evict()
+
+    def get_or_build(self, key, build):
+        df = self.get(key)
+        if df is None:
+            df = build()
+            self.put(key, df)
+        return df
+
+    def size(self):
+        with self._lock:
+            return sum(size for _, size in self._entries.values())
+
+    def evict(self):
+        """Drop least recently used frames until the cache fits in max_bytes, always keeping the newest one."""
+        removed = 0
+        with self._lock:
+            total = sum(size for _, size in self._entries.values())
+            while len(self._entries) > 1 and total > self.max_bytes:
+                _, (_, size) = self._entries.popitem(last=False)
+                total -= size
+                removed += 1
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or purge the NAV report parse cache.")
+    parser.add_argument('--dir', default=None, help=f"Cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--max-mb', type=float, default=None, help="Size cap used by 'evict'")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('info', help="Show cache location, size and entries")
+    commands.add_parser('evict', help="Evict least recently used entries down to the size cap")
+    purge_parser = commands.add_parser('purge', help="Delete cache entries")
+    purge_parser.add_argument('--older-than-days', type=float, default=None,
+                              help="Only delete entries not used in this many days")
+    args = parser.parse_args()
+
+    cache = ParseCache(args.dir, args.max_mb)
+
+    if args.command == 'info':
+        entries = cache.entries()
+        total = sum(size for _, size, _ in entries)
+        print(f"Cache directory: {cache.cache_dir}")
+        print(f"Entries: {len(entries)}  Size: {total / 1024 / 1024:.1f} MB  Cap: {cache.max_bytes / 1024 / 1024:.0f} MB")
+        for path, size, last_used in reversed(entries):
+            used = datetime.fromtimestamp(last_used).strftime('%Y-%m-%d %H:%M')
+            print(f"  {used}  {size / 1024:10.1f} KB  {os.path.basename(path)}")
+    elif args.command == 'evict':
+        print(f"Evicted {cache.evict()} entries")
+    elif args.command == 'purge':
+        print(f"Removed {cache.purge(args.older_than_days)} entries")
+
+
+if __name__ == "__main__":
+    main()
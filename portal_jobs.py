@@ -0,0 +1,172 @@
+import os
+import queue
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_control import CircuitOpen, RateController, backoff_delay
+
+# What the browser (gopx_portal.py) and HTTP (gopx_http.py) downloaders share. Nothing here
+# needs selenium, so the HTTP client and the stub portal run without it.
+
+# Longest waits, in seconds, for a portal page and for the portal to build a report
+PAGE_TIMEOUT = 30
+REPORT_TIMEOUT = 15 * 60
+
+# Concurrent downloads (download_pool): the most sessions run side by side, and the spacing in
+# seconds between two submissions to the portal. Both adapt to how the portal copes, see
+# rate_control.RateController. Submitting every date at once makes it answer each one with
+# an "Error" alert
+DEFAULT_WORKERS = 3
+SUBMIT_STAGGER = 20
+MIN_SUBMIT_DELAY = 5
+MAX_SUBMIT_DELAY = 5 * 60
+
+# A failed date is tried again up to MAX_DATE_RETRIES times, each after a random pause of up to
+# RETRY_BASE_DELAY * 2**retry seconds (never more than RETRY_MAX_DELAY)
+MAX_DATE_RETRIES = 3
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 10 * 60
+
+# Circuit breaker: BREAKER_FAILURES failures in the last BREAKER_WINDOW dates pause the whole job
+# for BREAKER_COOLDOWN seconds (doubled for each trip in a row), and it gives up after BREAKER_MAX_TRIPS
+BREAKER_WINDOW = 6
+BREAKER_FAILURES = 3
+BREAKER_COOLDOWN = 5 * 60
+BREAKER_MAX_TRIPS = 3
+
+
+class PortalAlert(Exception):
+    """The portal answered with a JavaScript alert (usually just "Error") instead of the next page."""
+
+
+class WaitTimeout(TimeoutError):
+    """wait_until gave up: the portal or the download did not get there in time."""
+
+
+def default_target_folder(client):
+    return 'C:\\' + client + '\\Daily Pricing'
+
+
+def session_download_path(target_folder):
+    """
+    A new, unique folder name for one session's downloads, not created yet. It sits under the
+    target folder, so a finished file is on the same drive and moving it there is a rename.
+    """
+    return os.path.join(target_folder, '.downloads', f'session-{uuid.uuid4().hex}')
+
+
+def session_download_dir(target_folder):
+    """A new empty folder for one session's downloads (see session_download_path)."""
+    path = session_download_path(target_folder)
+    os.makedirs(path)
+    return path
+
+
+def remove_download_dir(path):
+    """Delete a session's download folder, and the .downloads folder above it once no session uses it."""
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass  # Another session still has its folder there
+
+
+def wait_until(condition, timeout, description, first_interval=0.25, max_interval=10):
+    """
+    Call condition() until it returns something truthy and return that, polling quickly at first
+    and backing off (x1.5 per attempt, up to max_interval) for slow steps.
+    Raises WaitTimeout after `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    interval = first_interval
+    while True:
+        result = condition()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise WaitTimeout(f"Timed out after {timeout}s waiting for {description}")
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 1.5, max_interval)
+
+
+def save_download(downloaded, target_folder, client, target_date_str):
+    """
+    Move a finished download to <target_folder>\\<client>_ALL_OTC_<date>.xlsx, replacing an older copy.
+    The session folder is on the same drive, so this is a single atomic rename: no copy, and
+    no half-written report is ever visible under the final name.
+    """
+    new_name = os.path.join(target_folder, client + '_ALL_OTC_' + target_date_str + '.xlsx')
+    os.replace(downloaded, new_name)
+    return new_name
+
+
+def download_pool(dates, open_session, workers=DEFAULT_WORKERS, log=print, on_result=None, controller=None):
+    """
+    Download the reports for many valuation dates with a pool of at most `workers` sessions.
+    `open_session(log, gate)` makes the session of each worker (a browser or HTTP session, see
+    gopx_portal.download_dates and gopx_http.download_dates_http); it is used as a context manager
+    and its download(date) returns the saved path. Each worker takes the next date when it is
+    done with one. A RateController decides how many sessions work at once and how far apart
+    logins and exports are, from how the portal has been coping, and pauses the whole job when too
+    many dates fail. A failed date is put back and tried again later with a jittered, growing pause,
+    up to MAX_DATE_RETRIES times.
+    `on_result(date, result)` is called from the worker threads as each date finishes.
+    Returns {date: saved path, or the exception it failed with}, in the order of `dates`.
+    """
+    pending = queue.Queue()
+    for target_date_str in dates:
+        pending.put((target_date_str, 0))
+    results = {}
+    workers = max(1, min(workers, len(dates)))
+    if controller is None:
+        controller = RateController(workers, SUBMIT_STAGGER, MIN_SUBMIT_DELAY, MAX_SUBMIT_DELAY,
+                                    window=BREAKER_WINDOW, max_failures=BREAKER_FAILURES,
+                                    cooldown=BREAKER_COOLDOWN, max_trips=BREAKER_MAX_TRIPS, log=log)
+
+    def finish(target_date_str, result):
+        results[target_date_str] = result
+        if on_result is not None:
+            on_result(target_date_str, result)
+
+    def worker(number):
+        def session_log(message):
+            log(f"[session {number}] {message}")
+
+        with open_session(session_log, controller) as session:
+            while True:
+                try:
+                    target_date_str, retries = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    controller.acquire()
+                except CircuitOpen as e:
+                    finish(target_date_str, e)
+                    continue
+
+                session_log(f"Processing data for {target_date_str}")
+                started = time.monotonic()
+                try:
+                    saved = session.download(target_date_str)
+                except Exception as e:
+                    controller.release(False)
+                    if retries < MAX_DATE_RETRIES and not isinstance(e, CircuitOpen):
+                        delay = backoff_delay(retries, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+                        session_log(f"Failed to process data for {target_date_str}: {e}, trying again in {delay:.0f}s")
+                        time.sleep(delay)
+                        pending.put((target_date_str, retries + 1))
+                    else:
+                        session_log(f"Failed to process data for {target_date_str}: {e}")
+                        finish(target_date_str, e)
+                else:
+                    controller.release(True, time.monotonic() - started)
+                    session_log(f"Successfully downloaded report for {target_date_str}")
+                    finish(target_date_str, saved)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(worker, number) for number in range(1, workers + 1)]:
+            future.result()
+    return {target_date_str: results.get(target_date_str) for target_date_str in dates}
@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpen(Exception):
+    """The circuit breaker tripped too many times in a row and the job was abandoned."""
+
+
+def backoff_delay(attempt, base, cap):
+    """Exponential backoff with full jitter: a random pause between 0 and min(cap, base * 2**attempt) seconds."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RateController:
+    """
+    Concurrency limit and spacing between submissions for a job run against a service that
+    breaks under load, adjusted AIMD style from the outcomes it is told about:
+      - a success that took no longer than usual adds 1/limit to the concurrency limit (about
+        one more worker per round of successes) and takes `delay_step` seconds off the spacing;
+      - a failure, or a success more than `slow_factor` times slower than usual, halves the
+        limit and doubles the spacing.
+    On top sits a circuit breaker: once `max_failures` of the last `window` outcomes failed,
+    no new work starts for `cooldown` seconds, then one task is let through (half open) and its
+    success closes the breaker again. Each trip in a row doubles the cooldown; after `max_trips`
+    the job is abandoned and acquire()/wait() raise CircuitOpen.
+
+    Workers call acquire() before a task and release() after it; wait() is called just before
+    each submission within a task, to space them out.
+    """
+
+    def __init__(self, max_concurrency, initial_delay, min_delay, max_delay, delay_step=5, slow_factor=2.0,
+                 window=6, max_failures=3, cooldown=300, max_trips=3, log=print):
+        self.max_concurrency = max_concurrency
+        self.limit = 1.0  # Start with one worker and widen as the service keeps up
+        self.delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay_step = delay_step
+        self.slow_factor = slow_factor
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.max_trips = max_trips
+        self.log = log
+
+        self.active = 0
+        self.latency = None  # Moving average of successful task times
+        self.outcomes = deque(maxlen=window)
+        self.state = 'closed'  # 'open' while paused, 'half-open' while a single task probes the service
+        self.open_until = 0.0
+        self.trips = 0
+        self.aborted = False
+        self._next_submit = 0.0
+        self._cond = threading.Condition()
+
+    def _check_circuit(self):
+        """Seconds left in the pause, 0 once work may start. Call with the lock held."""
+        if self.aborted:
+            raise CircuitOpen(f"Gave up after pausing {self.max_trips} times for too many failures")
+        if self.state == 'open':
+            remaining = self.open_until - time.monotonic()
+            if remaining > 0:
+                return remaining
+            self.state = 'half-open'
+            self.log("Pause over, trying one request")
+        return 0
+
+    def acquire(self):
+        """Block until a task may start: within the concurrency limit and not paused by the breaker."""
+        with self._cond:
+            while True:
+                remaining = self._check_circuit()
+                if not remaining:
+                    allowed = 1 if self.state == 'half-open' else int(self.limit)
+                    if self.active < allowed:
+                        self.active += 1
+                        return
+                self._cond.wait(remaining or None)
+
+    def wait(self):
+        """Block until the next submission slot, `delay` seconds after the one before it."""
+        with self._cond:
+            while True:
+                remaining = self._check_circuit()
+                if not remaining:
+                    break
+                self._cond.wait(remaining)
+            now = time.monotonic()
+            slot = max(now, self._next_submit)
+            self._next_submit = slot + self.delay
+        time.sleep(slot - now)
+
+    def release(self, success, latency=None):
+        """Record how a task went (its duration in seconds if it succeeded) and adjust the rate."""
+        with self._cond:
+            self.active -= 1
+            if self.aborted:
+                self._cond.notify_all()
+                return
+            slow = success and latency is not None and self.latency is not None and latency > self.slow_factor * self.latency
+            if success and latency is not None:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+            if success and not slow:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.delay = max(self.min_delay, self.delay - self.delay_step)
+            else:
+                self.limit = max(1.0, self.limit / 2)
+                self.delay = min(self.max_delay, self.delay * 2)
+
+            if self.state == 'half-open':
+                if success:
+                    self.state = 'closed'
+                    self.trips = 0
+                    self.outcomes.clear()
+                    self.log("Service is answering again, resuming")
+                else:
+                    self._trip()
+            elif self.state == 'closed':
+                # Tasks still running when the breaker opened do not count towards the next trip
+                self.outcomes.append(success)
+                if list(self.outcomes).count(False) >= self.max_failures:
+                    self._trip()
+            self._cond.notify_all()
+
+    def _trip(self):
+        self.trips += 1
+        self.outcomes.clear()
+        self.limit = 1.0
+        if self.trips > self.max_trips:
+            self.aborted = True
+            self.log(f"Too many failures after {self.max_trips} pauses, giving up")
+            return
+        pause = self.cooldown * 2 ** (self.trips - 1)
+        self.state = 'open'
+        self.open_until = time.monotonic() + pause
+        self.log(f"Too many failures, pausing all requests for {pause:.0f}s")
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+# Memo of every distinct rate string seen so far -> (is an index name, numeric rate).
+# The same handful of index names and fixed rates repeat across thousands of trades and days.
+_RATE_CACHE = {}
+
+
+def _classify_strings(strings):
+    """
+    Classify rate strings with vectorized string ops.
+    A string is a numeric rate if, once '%' and spaces are removed, it is digits
+    with at most one '.' and one '-' (the same test the old get_index used).
+    """
+    strings = pd.Series(strings, dtype=object)
+    cleaned = strings.str.replace('%', '', regex=False).str.replace(' ', '', regex=False)
+    is_numeric = cleaned.str.replace('.', '', n=1, regex=False).str.replace('-', '', n=1, regex=False).str.isdigit()
+    rates = pd.to_numeric(cleaned.where(is_numeric), errors='coerce')
+    return ~is_numeric.to_numpy(dtype=bool), rates.to_numpy(dtype=float)
+
+
+def classify_rate_values(values):
+    """
+    Return (is_index, numeric_rate) arrays for a Rec Rate / Pay Rate column.
+    Each distinct string is classified once and memoized; non-string values
+    (floats from the XLSX report, NaN) are always numeric rates.
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    uniques = np.asarray(uniques, dtype=object)
+
+    new_strings = [u for u in uniques if isinstance(u, str) and u not in _RATE_CACHE]
+    if new_strings:
+        is_index, rates = _classify_strings(new_strings)
+        _RATE_CACHE.update(zip(new_strings, zip(is_index.tolist(), rates.tolist())))
+
+    unique_is_index = np.zeros(len(uniques) + 1, dtype=bool)  # last slot serves the NaN code (-1)
+    unique_rates = np.full(len(uniques) + 1, np.nan)
+    for i, value in enumerate(uniques):
+        if isinstance(value, str):
+            unique_is_index[i], unique_rates[i] = _RATE_CACHE[value]
+        elif isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            unique_rates[i] = value
+
+    return unique_is_index[codes], unique_rates[codes]
+
+
+def detect_index(rec_rate, pay_rate):
+    """
+    Work out the floating rate index and the fixed rate of each trade.
+    The Index is the Rec Rate if it is not a number, else the Pay Rate if that is not
+    a number, else None. The Fixed Rate is the numeric value of the other leg (NaN when
+    neither leg is an index), as quoted in the report with any '%' removed.
+    Returns (index, fixed_rate) Series aligned with rec_rate.
+    """
+    rec_values = np.asarray(rec_rate, dtype=object)
+    pay_values = np.asarray(pay_rate, dtype=object)
+    rec_is_index, rec_rates = classify_rate_values(rec_values)
+    pay_is_index, pay_rates = classify_rate_values(pay_values)
+
+    use_pay = ~rec_is_index & pay_is_index
+    index = np.where(rec_is_index, rec_values, np.where(use_pay, pay_values, None))
+    fixed_rate = np.where(rec_is_index, pay_rates, np.where(use_pay, rec_rates, np.nan))
+
+    row_index = getattr(rec_rate, 'index', None)
+    return pd.Series(index, index=row_index, dtype=object), pd.Series(fixed_rate, index=row_index)
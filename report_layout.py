@@ -0,0 +1,208 @@
+import csv
+import hashlib
+import io
+import os
+import threading
+
+# Only this much of a CSV is read to find its header, the preamble is a few hundred bytes
+SNIFF_BYTES = 64 * 1024
+
+# Rows of an IRS sheet searched for the header
+SNIFF_ROWS = 50
+
+# The lower header row is the first row holding all of these labels
+HEADER_ANCHORS = ('Maturity Date', 'Ccy', 'Rec Rate', 'Pay Rate')
+
+# Header groups (the row above the labels) used to tell apart labels that appear more than once
+FINAL_VS_COUNTERPARTY = 'Final Source vs Counterparty / Clearing Member'
+SSC_SOURCE = 'SS&C GlobeOp Source'
+SSC_TRADE_ATTRIBUTES = 'SS&C GlobeOp Trade Attributes'
+
+# Labels of the numeric fields. They are parsed as floats (thousands separators allowed) by the readers
+NUMERIC_LABELS = (
+    'Diff. in MV/IR DV01 or Diff. in MV/IDV01', 'Difference in MV', 'NAV Tolerance Analysis',
+    'IR DV01', 'MV Base', 'Notional',
+)
+
+# Fields are (output name, labels, group, offset): the column found under the first label that
+# matches, moved `offset` columns along. A label is matched against the lower header row, or the
+# group row over a blank lower cell (e.g. GTID); an int label is the n-th column with a blank
+# header, for exports that lost the group row. `group` is only needed when a label is used by
+# more than one source. An output name of None keeps the header label.
+
+# Columns of the derivatives CSV the processors use, in the order of their selected_columns lists
+DERIVATIVES_FIELDS = [
+    ('Trade ID 1', ('GTID', 0), None, 0),                           # Column A
+    ('Trade ID 2', ('Original GTID', 1), None, 0),                  # Column B
+    ('Product Sub Type', ('Instrument Sub Type', 2), None, 0),      # Column F
+    (None, ('Diff. in MV/IR DV01 or Diff. in MV/IDV01',), FINAL_VS_COUNTERPARTY, 0),  # Column V
+    (None, ('Difference in MV',), FINAL_VS_COUNTERPARTY, 0),        # Column W
+    (None, ('NAV Tolerance Analysis',), FINAL_VS_COUNTERPARTY, 0),  # Column X
+    (None, ('Trade Date',), SSC_TRADE_ATTRIBUTES, -1),              # Column AZ, just before Trade Date
+    (None, ('Trade Date',), SSC_TRADE_ATTRIBUTES, 0),               # Column BA
+    (None, ('Effective Date',), SSC_TRADE_ATTRIBUTES, 0),           # Column BB
+    (None, ('Maturity Date',), SSC_TRADE_ATTRIBUTES, 0),            # Column BC
+    (None, ('Ccy',), SSC_TRADE_ATTRIBUTES, 0),                      # Column BD
+    (None, ('Notional',), SSC_TRADE_ATTRIBUTES, 0),                 # Column BE
+    (None, ('Rec Rate',), SSC_TRADE_ATTRIBUTES, 0),                 # Column BF
+    (None, ('Pay Rate',), SSC_TRADE_ATTRIBUTES, 0),                 # Column BG
+    (None, ('IR DV01',), SSC_SOURCE, 0),                            # Column AG
+    (None, ('Final Source Load Time',), 'Counterparty/ Clearing Member', 0),  # Column BO
+]
+
+# Columns of the IRS sheet the workbook processor uses, and what it calls them
+IRS_FIELDS = [
+    ('Trade ID 1', ('GTID',), None, 0),
+    ('Original GTID', ('Original GTID',), None, 0),
+    ('Counterparty MV Base', ('MV Base',), 'Counterparty / Clearing Member', 0),
+    ('SS&C MV Base', ('MV Base',), SSC_SOURCE, 0),
+    ('Product Sub Type', ('Instrument Sub Type',), None, 0),
+    ('SS&C IR DV01', ('IR DV01',), SSC_SOURCE, 0),
+    ('Trade Date', ('Trade Date',), SSC_TRADE_ATTRIBUTES, 0),
+    ('Effective Date', ('Effective Date',), SSC_TRADE_ATTRIBUTES, 0),
+    ('Maturity Date', ('Maturity Date',), SSC_TRADE_ATTRIBUTES, 0),
+    ('Currency', ('Ccy',), SSC_TRADE_ATTRIBUTES, 0),
+    ('Notional', ('Notional',), SSC_TRADE_ATTRIBUTES, 0),
+    ('Rec Rate', ('Rec Rate',), SSC_TRADE_ATTRIBUTES, 0),
+    ('Pay Rate', ('Pay Rate',), SSC_TRADE_ATTRIBUTES, 0),
+    ('Final Source Load Time', ('Final Source Load Time',), 'Counterparty/ Clearing Member', 0),
+    ('Difference in MV', ('Difference in MV',), FINAL_VS_COUNTERPARTY, 0),
+    ('NAV Tolerance Analysis', ('NAV Tolerance Analysis',), FINAL_VS_COUNTERPARTY, 0),
+    ('Diff. in MV/IR DV01', ('Diff. in MV/IR DV01 or Diff. in MV/IDV01',), FINAL_VS_COUNTERPARTY, 0),
+    ('BBG Curve 4.30pm futures Snap', ('Name',), 'Third Party', 0),
+    ('LCH Curve w/ additional futs', ('Name',), 'Third Party2', 0),
+    ('BBG REFERENCE Curve MV (4.30 Futs Snap)', ('MV Base',), 'Third Party', 0),
+    ('LCH Test Curve MV', ('MV Base',), 'Third Party2', 0),
+]
+
+
+class ReportLayout:
+    """
+    Compiled schema of one report layout: where the header is, which file columns hold the
+    fields (in field order) and the names they get. Built once per layout fingerprint.
+    """
+
+    def __init__(self, fingerprint, header_row, positions, names, numeric):
+        self.fingerprint = fingerprint
+        self.header_row = header_row  # Row of the lower header labels, the data starts below it
+        self.positions = positions
+        self.names = names
+        self.numeric = numeric  # Names of the fields parsed as floats
+
+
+# Compiled layouts by (field set, fingerprint), shared by every read in the process
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def _cell(value):
+    return '' if value is None or str(value) == 'nan' else str(value).strip()
+
+
+def find_header_row(rows, anchors=HEADER_ANCHORS):
+    """Index of the first row containing every anchor label, or None."""
+    for i, row in enumerate(rows):
+        cells = {_cell(value) for value in row}
+        if all(anchor in cells for anchor in anchors):
+            return i
+    return None
+
+
+def layout_fingerprint(header_row, group_cells, label_cells):
+    """Short digest of where the header sits and what it says. Equal fingerprints, same layout."""
+    text = repr((header_row, [_cell(v) for v in group_cells], [_cell(v) for v in label_cells]))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _resolve(label, group, labels, raw_groups, groups, blanks):
+    """Column position of one field label, None if not found. Raises if the label is ambiguous."""
+    if isinstance(label, int):
+        return blanks[label] if label < len(blanks) else None
+
+    matches = [i for i, value in enumerate(labels) if value == label]
+    if not matches:
+        matches = [i for i, value in enumerate(labels) if not value and raw_groups[i] == label]
+    if len(matches) > 1 and group is not None:
+        matches = [i for i in matches if groups[i] == group]
+    if len(matches) > 1:
+        raise ValueError(f"Report header has {len(matches)} '{label}' columns and no group to choose between them")
+    return matches[0] if matches else None
+
+
+def compile_layout(fields, header_row, group_cells, label_cells, required=True):
+    """
+    Map each field to its column in this header. Missing fields raise a ValueError when
+    `required`, otherwise they are left out. Use get_layout to reuse compiled layouts.
+    """
+    labels = [_cell(v) for v in label_cells]
+    raw_groups = [_cell(v) for v in group_cells] + [''] * (len(labels) - len(group_cells))
+    raw_groups = raw_groups[:len(labels)]
+    # Merged group cells only hold their label in the first cell
+    groups = []
+    for i, value in enumerate(raw_groups):
+        groups.append(value or (groups[-1] if groups and labels[i] else ''))
+    blanks = [i for i, value in enumerate(labels) if not value]
+
+    positions, names, numeric = [], [], []
+    for name, candidates, group, offset in fields:
+        position = None
+        for label in candidates:
+            position = _resolve(label, group, labels, raw_groups, groups, blanks)
+            if position is not None:
+                break
+        if position is not None:
+            position += offset
+        if position is None or not 0 <= position < len(labels):
+            if required:
+                raise ValueError(f"Report header has no '{candidates[0]}' column (header row {header_row + 1})")
+            continue
+        positions.append(position)
+        names.append(name or labels[position] or f'Unnamed: {position}')
+        if offset == 0 and label in NUMERIC_LABELS:
+            numeric.append(names[-1])
+
+    fingerprint = layout_fingerprint(header_row, group_cells, label_cells)
+    return ReportLayout(fingerprint, header_row, positions, names, numeric)
+
+
+def get_layout(fields, rows, required=True, anchors=HEADER_ANCHORS):
+    """
+    Find the header in the first rows of a report and return its compiled layout.
+    A layout seen before (same fingerprint) is served from the cache without compiling it again.
+    """
+    header_row = find_header_row(rows, anchors)
+    if header_row is None:
+        raise ValueError(f"No header row with {', '.join(anchors)} found at the top of the report")
+
+    group_cells = rows[header_row - 1] if header_row > 0 else []
+    key = (id(fields), required, layout_fingerprint(header_row, group_cells, rows[header_row]))
+    with _layouts_lock:
+        layout = _layouts.get(key)
+    if layout is None:
+        layout = compile_layout(fields, header_row, group_cells, rows[header_row], required)
+        with _layouts_lock:
+            _layouts[key] = layout
+    return layout
+
+
+def sniff_rows(file_to_read, size=SNIFF_BYTES):
+    """
+    The complete CSV rows within the first `size` bytes of a path or file object.
+    A file object is put back at the start.
+    """
+    if isinstance(file_to_read, (str, os.PathLike)):
+        with open(file_to_read, 'rb') as f:
+            head = f.read(size)
+    else:
+        head = file_to_read.read(size)
+        file_to_read.seek(0)
+
+    text = head.decode('utf-8-sig', errors='replace')
+    if len(head) == size:
+        text = text[:text.rfind('\n') + 1]  # Drop the partial last line
+    return list(csv.reader(io.StringIO(text)))
+
+
+def sniff_csv_layout(file_to_read, fields=DERIVATIVES_FIELDS):
+    """Layout of a derivatives CSV, from its first few KB only."""
+    return get_layout(fields, sniff_rows(file_to_read))
@@ -0,0 +1,32 @@
+import warnings
+
+import pandas as pd
+
+from breach_cube import top_n_per_group
+from trade_schema import join_labels
+
+
+def test_top_n_per_group_breaks_ties_like_nlargest():
+    # Labels first appear out of alphabetical order, and several counts tie across the cut-off
+    trades = pd.DataFrame({
+        'Ccy': pd.Categorical(['SEK'] * 7 + ['USD'] * 4 + ['EUR'] * 2),
+        'Index': ['STIBOR3M', 'JIBAR3M', 'EURIBOR6M', 'USDSOFR', 'STIBOR3M', 'JIBAR3M', 'EURIBOR6M',
+                  'USDSOFR', 'SOFR', 'FEDFUNDS', 'LIBOR3M', 'EURIBOR6M', 'ESTR'],
+        'Maturity Year': ['2030', '2027', '2035', '2027', '2027', '2035', '2030',
+                          '2030', '2030', '2030', '2030', '2027', '2027'],
+        'Count': [4, 4, 4, 4, 3, 3, 3, 2, 2, 2, 2, 1, 1],
+    })
+    trades['Index_Maturity'] = join_labels(trades['Index'], trades['Maturity Year'])
+    counts = trades.groupby(['Ccy', 'Index_Maturity'], observed=True)['Count'].sum().reset_index(name='Count')
+
+    # What the processors used to do, on the same data held as plain strings
+    plain = trades.astype({'Ccy': str, 'Index_Maturity': str})
+    plain = plain.groupby(['Ccy', 'Index_Maturity'])['Count'].sum().reset_index(name='Count')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        expected = plain.groupby('Ccy').apply(lambda x: x.nlargest(3, 'Count')).reset_index(drop=True)
+
+    result = top_n_per_group(counts, 'Ccy', 'Count', n=3)
+    assert result['Ccy'].astype(str).tolist() == expected['Ccy'].tolist()
+    assert result['Index_Maturity'].astype(str).tolist() == expected['Index_Maturity'].tolist()
+    assert result['Count'].tolist() == expected['Count'].tolist()
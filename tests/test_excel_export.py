@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from excel_export import write_report
+from trade_schema import compact_trades
+
+
+def test_float32_measures_export_as_their_rounded_values(tmp_path):
+    source = pd.DataFrame({
+        'Sensitivity Diff Check (BPs)': [-12.21, 0.07, np.nan, 1234.56],
+        'NAV Break Check (BPs)': [3.3, -0.01, 99.99, 0.0],
+        'Fixed Rate': [0.00424, 0.04974, 0.0345, np.nan],
+    })
+    df = compact_trades(source.copy())
+    assert (df.dtypes == np.float32).all()
+
+    output = tmp_path / 'report.xlsx'
+    write_report(df, output, flag_columns=[])
+
+    rows = list(load_workbook(output).active.iter_rows(min_row=2, values_only=True))
+    for col_idx, col in enumerate(source.columns):
+        for row, expected in zip(rows, source[col]):
+            if np.isnan(expected):
+                assert row[col_idx] is None
+            else:
+                assert row[col_idx] == expected
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+# Low-cardinality text fields, held as categoricals
+CATEGORY_COLUMNS = ['Ccy', 'Currency', 'Product Sub Type', 'Index', 'Index_Maturity', 'Product_Ccy']
+
+# Breach flags. Sensitivity Breach is always evaluated; Tolerance Breach stays unset (<NA>)
+# for clients without a tolerance threshold
+BOOL_COLUMNS = ['Sensitivity Breach']
+NULLABLE_BOOL_COLUMNS = ['Tolerance Breach']
+
+# Date columns and the string format they arrive in
+DATE_COLUMNS = {
+    'Report Date': '%Y%m%d',
+    'Valuation Date': '%d%m%Y'
+}
+
+# Trade date columns as the reports give them, strings in the CSV and mostly datetimes in the workbook
+TRADE_DATE_COLUMNS = ['Trade Date', 'Effective Date', 'Maturity Date', 'Final Source Load Time']
+
+# Formats tried, in order, on the distinct strings of a trade date column. Month first, as pandas'
+# own inference reads an ambiguous 03/04/2025
+DATE_FORMATS = ['%m/%d/%Y', '%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S', 'ISO8601', '%d-%b-%Y', '%d%m%Y']
+
+# Measures that are only displayed, never compared against a breach threshold. Held as float32;
+# the export writes them back as the decimals they were rounded to (see excel_export.py)
+FLOAT32_COLUMNS = ['Sensitivity Diff Check (BPs)', 'NAV Break Check (BPs)', 'Fixed Rate']
+
+_FLAG_VALUES = {"TRUE": True, "FALSE": False, True: True, False: False}
+
+
+def memory_usage(df):
+    """Total memory used by a frame in bytes, including the Python strings in object columns."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def describe_memory_change(before, after):
+    saved = 1 - after / before if before else 0
+    return f"Trade data memory: {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB ({saved:.0%} smaller)"
+
+
+def to_flag(values, nullable=False):
+    """Convert "TRUE"/"FALSE" strings (or bools) to a boolean column. Anything else is <NA>, or False if not nullable."""
+    if values.dtype == object:
+        values = values.map(_FLAG_VALUES)
+    values = values.astype('boolean')
+    return values if nullable else values.fillna(False).astype(bool)
+
+
+def compact_trades(df):
+    """
+    Cast the normalised trade frame to its compact schema, in place.
+    Columns that are not present, or already have the right type, are left alone.
+    """
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+
+    for col in BOOL_COLUMNS:
+        if col in df.columns:
+            df[col] = to_flag(df[col])
+    for col in NULLABLE_BOOL_COLUMNS:
+        if col in df.columns:
+            df[col] = to_flag(df[col], nullable=True)
+
+    for col, date_format in DATE_COLUMNS.items():
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], format=date_format, errors='coerce')
+
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float32)
+
+    return df
+
+
+def parse_dates(values, formats=DATE_FORMATS):
+    """
+    datetime64 column from a column of dates, parsing each distinct value only once.
+    Maturity dates repeat across thousands of trades, so this is a handful of parses instead of
+    one per row. Strings are tried against `formats` in order, those none of them fit go through
+    pandas' inference; anything unparseable is NaT. A datetime64 column is returned as it is.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+
+    # Datetimes from the workbook need no format
+    is_text = uniques.map(lambda value: isinstance(value, str))
+    parsed[~is_text] = pd.to_datetime(uniques[~is_text], errors='coerce')
+
+    left = uniques[is_text].str.strip()
+    for date_format in list(formats) + ['mixed']:
+        if left.empty:
+            break
+        dates = pd.to_datetime(left, format=date_format, errors='coerce')
+        parsed[dates.index] = dates
+        left = left[dates.isna()]
+
+    # Missing values have code -1, which picks the NaT appended at the end
+    parsed = np.append(parsed.to_numpy(), np.datetime64('NaT', 'ns'))
+    return pd.Series(parsed[codes], index=values.index, name=values.name)
+
+
+def normalise_dates(df, columns=TRADE_DATE_COLUMNS):
+    """Parse the trade date columns of a report frame (see parse_dates), in place. Missing columns are skipped."""
+    for col in columns:
+        if col in df.columns:
+            df[col] = parse_dates(df[col])
+    return df
+
+
+def join_labels(left, right, sep='_'):
+    """
+    Categorical equivalent of `left + sep + right` for two label columns.
+    Each distinct label is built only once; rows where either side is missing are NaN.
+    The categories are sorted, so groupbys on the result come out in label order as on strings.
+    """
+    index = getattr(left, 'index', None)
+    left = pd.Categorical(left)
+    right = pd.Categorical(right)
+
+    n_right = max(len(right.categories), 1)
+    pair_codes = left.codes.astype(np.int64) * n_right + right.codes
+    pair_codes[(left.codes < 0) | (right.codes < 0)] = -1
+
+    codes, pairs = pd.factorize(pair_codes)
+    labels = np.array([
+        f"{left.categories[pair // n_right]}{sep}{right.categories[pair % n_right]}" if pair >= 0 else None
+        for pair in pairs
+    ], dtype=object)
+
+    # Different pairs can spell the same label, and the missing pair maps to NaN
+    label_codes, categories = pd.factorize(labels, sort=True)
+    codes = label_codes[codes]
+
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=index)